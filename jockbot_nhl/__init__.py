@@ -17,4 +17,28 @@
 #                                            \/_/\/_/\/_/\/_/\/___/                                         #
 #                                                                                                           #
 #############################################################################################################
-from . nhl import NHL, NHLTeam
+import importlib
+
+# Public names and the module they live in. Imported on first access so
+# the CLI client can start without loading numpy, requests or pytz
+_EXPORTS = {
+    'FileCache': ('_cache', 'FileCache'),
+    'RedisCache': ('_cache', 'RedisCache'),
+    'deadline': ('_helpers', '_deadline'),
+    'set_cache': ('_helpers', '_set_cache'),
+    'NHL': ('nhl', 'NHL'),
+    'NHLGameFeed': ('nhl', 'NHLGameFeed'),
+    'NHLTeam': ('nhl', 'NHLTeam'),
+    'PrefetchScheduler': ('_prefetch', 'PrefetchScheduler'),
+    'RosterTracker': ('_rosters', 'RosterTracker')
+}
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module, attribute = _EXPORTS[name]
+    value = getattr(importlib.import_module(f".{module}", __name__), attribute)
+    globals()[name] = value
+    return value
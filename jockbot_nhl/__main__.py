@@ -0,0 +1,5 @@
+import sys
+
+from jockbot_nhl._client import main
+
+sys.exit(main())
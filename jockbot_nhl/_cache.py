@@ -0,0 +1,146 @@
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import time
+import uuid
+
+from contextlib import contextmanager
+
+
+class FileCache:
+    """
+    Cache shared by every process on a host. Each entry is a JSON file and
+    fetches are serialized with a per-key file lock so only one worker
+    requests a missing entry. Point it at /dev/shm to keep it in shared memory
+    """
+    def __init__(self, path, ttl=300):
+        self.path = path
+        self.ttl = ttl
+        os.makedirs(self.path, exist_ok=True)
+
+    def _file(self, key):
+        return os.path.join(self.path, hashlib.sha1(key.encode()).hexdigest())
+
+    @contextmanager
+    def _lock(self, key):
+        with open(f"{self._file(key)}.lock", 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def get(self, key):
+        """Return the cached value for a key or None if missing or expired"""
+        try:
+            with open(self._file(key), 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry['expires'] < time.time():
+            return None
+        return entry['value']
+
+    def set(self, key, value, ttl=None):
+        """Atomically write a value for a key"""
+        ttl = self.ttl if ttl is None else ttl
+        entry = {'expires': time.time() + ttl, 'value': value}
+        fd, tmp = tempfile.mkstemp(dir=self.path)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp, self._file(key))
+
+    def fetch(self, key, func, ttl=None):
+        """Return the cached value for a key, calling func to fill it on a miss"""
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self._lock(key):
+            value = self.get(key)
+            if value is None:
+                value = func()
+                self.set(key, value, ttl)
+        return value
+
+    def clear(self):
+        """Remove every entry"""
+        for name in os.listdir(self.path):
+            os.remove(os.path.join(self.path, name))
+
+
+class RedisCache:
+    """
+    Cache shared through a Redis compatible server. client needs get, set
+    (with nx and ex keywords) and delete, as provided by redis.Redis
+    """
+    def __init__(self, client, ttl=300, prefix='jockbot_nhl:', lock_timeout=30, poll_interval=0.05):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+
+    def get(self, key):
+        """Return the cached value for a key or None if missing or expired"""
+        value = self.client.get(f"{self.prefix}{key}")
+        if value is None:
+            return None
+        return json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        """Write a value for a key"""
+        ttl = self.ttl if ttl is None else ttl
+        self.client.set(f"{self.prefix}{key}", json.dumps(value), ex=max(int(ttl), 1))
+
+    def fetch(self, key, func, ttl=None):
+        """Return the cached value for a key, calling func to fill it on a miss.
+        Workers that lose the race for the lock wait for the winner's value
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        lock = f"{self.prefix}lock:{key}"
+        # A unique token marks the lock as ours so a worker that timed out
+        # waiting never deletes a lock another worker holds
+        token = uuid.uuid4().hex
+        deadline = time.time() + self.lock_timeout
+        acquired = self.client.set(lock, token, nx=True, ex=self.lock_timeout)
+        while not acquired:
+            time.sleep(self.poll_interval)
+            value = self.get(key)
+            if value is not None:
+                return value
+            if time.time() > deadline:
+                break
+            acquired = self.client.set(lock, token, nx=True, ex=self.lock_timeout)
+        try:
+            value = self.get(key)
+            if value is None:
+                value = func()
+                self.set(key, value, ttl)
+        finally:
+            if acquired:
+                self._release(lock, token)
+        return value
+
+    def _release(self, lock, token):
+        """Delete a lock only if it still holds our token, it may have expired and been taken"""
+        held = self.client.get(lock)
+        if isinstance(held, bytes):
+            held = held.decode()
+        if held == token:
+            self.client.delete(lock)
+
+
+def _cache_from_env():
+    """Build a cache from JOCKBOT_NHL_CACHE, either a directory or a redis:// URL"""
+    location = os.environ.get('JOCKBOT_NHL_CACHE')
+    if not location:
+        return None
+    ttl = int(os.environ.get('JOCKBOT_NHL_CACHE_TTL', 300))
+    if location.startswith(('redis://', 'rediss://', 'unix://')):
+        import redis
+        return RedisCache(redis.Redis.from_url(location), ttl=ttl)
+    return FileCache(location, ttl=ttl)
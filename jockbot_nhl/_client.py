@@ -0,0 +1,95 @@
+import argparse
+import json
+import os
+import socket
+import sys
+
+from jockbot_nhl._exceptions import JockBotNHLException
+
+# Only the standard library is imported here so CLI queries start fast,
+# the NHL classes are imported for serve and the in-process fallback
+SOCKET_PATH = os.environ.get('JOCKBOT_NHL_SOCKET', '/tmp/jockbot_nhl.sock')
+OBJECTS = ('NHL', 'NHLPlayer', 'NHLTeam')
+
+
+def query(request, socket_path=SOCKET_PATH, timeout=30, fallback=True):
+    """Forward a query to the daemon. Runs it in process if no daemon is listening and fallback is set"""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(timeout)
+            client.connect(socket_path)
+            client.sendall(json.dumps(request).encode() + b'\n')
+            response = client.makefile('rb').readline()
+    except (FileNotFoundError, ConnectionRefusedError):
+        if not fallback:
+            raise JockBotNHLException(f"No jockbot_nhl daemon listening on {socket_path}")
+        return _query_in_process(request)
+    except OSError as error:
+        # Timeouts and permission errors fail the same way as errors inside the daemon
+        raise JockBotNHLException(f"Error querying jockbot_nhl daemon on {socket_path}: {error}") from error
+    if not response:
+        raise JockBotNHLException(f"jockbot_nhl daemon on {socket_path} closed the connection")
+    response = json.loads(response)
+    if not response['ok']:
+        raise JockBotNHLException(response['error'])
+    return response['result']
+
+
+def _query_in_process(request):
+    """Run a query without a daemon, raising JockBotNHLException for any error like the daemon does"""
+    from jockbot_nhl._daemon import _Instances, _execute
+    try:
+        return json.loads(json.dumps(_execute(request, _Instances()), default=str))
+    except JockBotNHLException:
+        raise
+    except Exception as error:
+        raise JockBotNHLException(str(error)) from error
+
+
+def _parse_kwarg(kwarg):
+    """Split a key=value CLI arg, decoding the value as JSON when possible"""
+    key, _, value = kwarg.partition('=')
+    try:
+        return key, json.loads(value)
+    except ValueError:
+        return key, value
+
+
+def main(argv=None):
+    """jockbot-nhl serve | jockbot-nhl query [--object NHLTeam --init boston] attribute [args]"""
+    parser = argparse.ArgumentParser(prog='jockbot-nhl')
+    parser.add_argument('--socket', default=SOCKET_PATH)
+    commands = parser.add_subparsers(dest='command')
+    serve_parser = commands.add_parser('serve', help='run the query daemon')
+    serve_parser.add_argument('--snapshot', help='snapshot file to warm start from')
+    serve_parser.add_argument('--prefetch', action='store_true', help='run the prefetch scheduler')
+    serve_parser.add_argument('--max-age', type=int, default=300, help='seconds to keep team and player objects')
+    query_parser = commands.add_parser('query', help='query the daemon')
+    query_parser.add_argument('--object', default='NHL', choices=OBJECTS)
+    query_parser.add_argument('--init', action='append', default=[], help='object constructor arg')
+    query_parser.add_argument('--no-fallback', action='store_true', help='fail if no daemon is running')
+    query_parser.add_argument('attribute')
+    query_parser.add_argument('args', nargs='*', help='positional args or key=value keyword args')
+    args = parser.parse_args(argv)
+    try:
+        if args.command == 'serve':
+            import logging
+            from jockbot_nhl._daemon import serve
+            logging.basicConfig(level=logging.INFO)
+            serve(args.socket, snapshot=args.snapshot, prefetch=args.prefetch, max_age=args.max_age)
+        elif args.command == 'query':
+            request = {
+                'object': args.object,
+                'init': args.init,
+                'attribute': args.attribute,
+                'args': [arg for arg in args.args if '=' not in arg],
+                'kwargs': dict(_parse_kwarg(arg) for arg in args.args if '=' in arg)
+            }
+            result = query(request, args.socket, fallback=not args.no_fallback)
+            print(json.dumps(result, indent=2) if isinstance(result, (dict, list)) else result)
+        else:
+            parser.print_help()
+    except JockBotNHLException as error:
+        print(error, file=sys.stderr)
+        return 1
+    return 0
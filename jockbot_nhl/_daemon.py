@@ -0,0 +1,172 @@
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+import types
+
+from jockbot_nhl._client import SOCKET_PATH
+from jockbot_nhl._exceptions import JockBotNHLException
+from jockbot_nhl.nhl import NHL, NHLPlayer, NHLTeam, _refresh_in_background
+
+OBJECTS = {'NHL': NHL, 'NHLTeam': NHLTeam, 'NHLPlayer': NHLPlayer}
+
+# Read only attributes and query methods a client may call. Anything else,
+# e.g. export_snapshot or load_snapshot, is never reachable over the socket
+LEAGUE_QUERIES = frozenset([
+    'conference_standings',
+    'current_season',
+    'division_standings',
+    'get_career_stats',
+    'get_player_info',
+    'get_player_stats',
+    'get_team_info',
+    'get_team_roster',
+    'get_team_schedule',
+    'get_team_stats',
+    'goalie_league_leaders',
+    'league_leaderboards',
+    'league_standings',
+    'live_scores',
+    'playoff_odds',
+    'recent_games',
+    'recent_scores',
+    'skater_league_leaders',
+    'snapshot_ages',
+    'standings',
+    'team_league_leaders',
+    'team_records',
+    'teams',
+    'todays_games',
+    'tomorrows_games',
+    'wildcard_standings'
+])
+QUERIES = {
+    'NHL': LEAGUE_QUERIES,
+    'NHLTeam': LEAGUE_QUERIES | {
+        'conference',
+        'conference_rank',
+        'division',
+        'division_rank',
+        'games_played',
+        'id',
+        'losses',
+        'name',
+        'otl',
+        'overall_rank',
+        'points',
+        'record',
+        'remaining_games',
+        'stat_percentiles',
+        'stat_ranks',
+        'stats',
+        'summary_stats',
+        'team',
+        'venue',
+        'wins'
+    },
+    'NHLPlayer': LEAGUE_QUERIES | {'career_stats', 'info', 'player', 'player_id', 'season_stats'}
+}
+
+
+class _Instances:
+    """Warm NHL, NHLTeam and NHLPlayer objects keyed by their constructor args.
+    Team and player objects are rebuilt and league standings are refetched
+    in the background after max_age seconds
+    """
+    def __init__(self, max_age=300):
+        self.max_age = max_age
+        self.league = NHL()
+        self.started = time.time()
+        self.objects = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def _refresh_league(self):
+        """Standings live on the NHL class for the life of the process, refetch them once older than max_age"""
+        fetched = NHL.snapshot_fetched.get('standings', self.started)
+        if time.time() - fetched > self.max_age:
+            _refresh_in_background(['standings'])
+
+    def get(self, name, init):
+        self._refresh_league()
+        if name == 'NHL':
+            return self.league
+        key = (name, tuple(init))
+        # One lock per key so concurrent queries for the same team or player
+        # build it once without blocking queries for anything else
+        with self.lock:
+            key_lock = self.locks.setdefault(key, threading.Lock())
+        with key_lock:
+            created, obj = self.objects.get(key, (0, None))
+            if time.time() - created > self.max_age:
+                obj = OBJECTS[name](*init)
+                self.objects[key] = (time.time(), obj)
+        return obj
+
+
+def _execute(request, instances):
+    """Run a query against a warm object. Return JSON serializable result"""
+    name = request.get('object', 'NHL')
+    attribute = request['attribute']
+    if name not in OBJECTS:
+        raise JockBotNHLException(f"Invalid object: {name}")
+    if attribute not in QUERIES[name]:
+        raise JockBotNHLException(f"Invalid attribute: {attribute}")
+    obj = instances.get(name, request.get('init', []))
+    result = getattr(obj, attribute)
+    if callable(result):
+        result = result(*request.get('args', []), **request.get('kwargs', {}))
+    if isinstance(result, types.GeneratorType):
+        result = list(result)
+    return result
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """One JSON request line in, one JSON response line out"""
+    def handle(self):
+        for line in self.rfile:
+            try:
+                result = _execute(json.loads(line), self.server.instances)
+                response = {'ok': True, 'result': result}
+            except Exception as error:
+                logging.error(f"Query error: {error}")
+                response = {'ok': False, 'error': str(error)}
+            self.wfile.write(json.dumps(response, default=str).encode() + b'\n')
+            self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def _remove_stale_socket(socket_path):
+    """Remove a socket file left behind by a dead daemon. Raise if a daemon is still listening"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(socket_path)
+        except ConnectionRefusedError:
+            os.remove(socket_path)
+            return
+    raise JockBotNHLException(f"A jockbot_nhl daemon is already listening on {socket_path}")
+
+
+def serve(socket_path=SOCKET_PATH, snapshot=None, prefetch=False, max_age=300):
+    """Keep a warm NHL instance resident and answer queries over a Unix socket"""
+    if os.path.exists(socket_path):
+        _remove_stale_socket(socket_path)
+    if snapshot and os.path.exists(snapshot):
+        NHL.load_snapshot(snapshot)
+    if prefetch:
+        from jockbot_nhl._prefetch import PrefetchScheduler
+        PrefetchScheduler().start()
+    server = _Server(socket_path, _Handler)
+    server.instances = _Instances(max_age=max_age)
+    logging.info(f"jockbot_nhl daemon listening on {socket_path}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(socket_path)
@@ -0,0 +1,8 @@
+class JockBotNHLException(Exception):
+    """Base class for jockbot_nhl exceptions"""
+    pass
+
+
+class JockBotNHLTimeout(JockBotNHLException):
+    """Raised when a request or a composite call runs out of time"""
+    pass
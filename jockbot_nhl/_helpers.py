@@ -1,20 +1,22 @@
+import contextvars
 import datetime
 import json
 import logging
 import os
 import requests
 import socket
+import threading
 import time
 
 from collections import OrderedDict, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from pytz import timezone
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
 
-
-class JockBotNHLException(Exception):
-    """Base class for jockbot_nhl exceptions"""
-    pass
+from jockbot_nhl._cache import _cache_from_env
+from jockbot_nhl._exceptions import JockBotNHLException, JockBotNHLTimeout
 
 
 def _get_config():
@@ -26,8 +28,143 @@ def _get_config():
 
 
 SESSION = requests.session()
-DATE = datetime.datetime.now(timezone('US/Eastern'))
 CONFIG = _get_config()
+CACHE = _cache_from_env()
+# Seconds a single request may take, and how long to wait before hedging it with a duplicate (None disables)
+REQUEST_TIMEOUT = 10
+HEDGE_DELAY = None
+DEADLINE = contextvars.ContextVar('jockbot_nhl_deadline', default=None)
+REFRESH = contextvars.ContextVar('jockbot_nhl_refresh', default=False)
+POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix='jockbot-nhl')
+HEDGE_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix='jockbot-nhl-hedge')
+
+
+def _set_cache(cache):
+    """Share API responses between processes through a FileCache or RedisCache. None disables caching"""
+    global CACHE
+    CACHE = cache
+
+
+@contextmanager
+def _deadline(seconds):
+    """Bound every request made inside the block, including those made by
+    _gather workers, to a shared budget of seconds. Nested budgets only shrink
+    """
+    if seconds is None:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    current = DEADLINE.get()
+    token = DEADLINE.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        DEADLINE.reset(token)
+
+
+@contextmanager
+def _refreshing():
+    """Fetch every request made inside the block from the NHL API and overwrite
+    its shared cache entry instead of serving a cached value
+    """
+    token = REFRESH.set(True)
+    try:
+        yield
+    finally:
+        REFRESH.reset(token)
+
+
+def _remaining():
+    """Seconds left in the current deadline, None when there is no deadline"""
+    deadline = DEADLINE.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def _timeout():
+    """Timeout for the next request, the smaller of REQUEST_TIMEOUT and the time left in the deadline"""
+    remaining = _remaining()
+    if remaining is None:
+        return REQUEST_TIMEOUT
+    if remaining <= 0:
+        raise JockBotNHLTimeout('Request budget exhausted')
+    return min(REQUEST_TIMEOUT, remaining)
+
+
+def _sleep(seconds):
+    """Sleep without overrunning the current deadline"""
+    remaining = _remaining()
+    time.sleep(seconds if remaining is None else max(min(seconds, remaining), 0))
+
+
+def _gather(calls, budget=None):
+    """Run calls concurrently under the current deadline, or a new one of budget seconds.
+    Cancel whatever is outstanding when the deadline expires. Return list of results
+    """
+    with _deadline(budget):
+        futures = [POOL.submit(contextvars.copy_context().run, call) for call in calls]
+        done, pending = wait(futures, timeout=_remaining())
+        if pending:
+            for future in pending:
+                future.cancel()
+            raise JockBotNHLTimeout(f"{len(pending)} of {len(futures)} requests did not finish in time")
+        return [future.result() for future in futures]
+
+
+def _hedged(func, delay):
+    """Call func, starting a duplicate attempt if the first has not answered after delay seconds.
+    Return whichever succeeds first
+    """
+    attempts = [HEDGE_POOL.submit(contextvars.copy_context().run, func)]
+    done, pending = wait(attempts, timeout=delay)
+    if not done:
+        attempts.append(HEDGE_POOL.submit(contextvars.copy_context().run, func))
+    error = None
+    while attempts:
+        done, pending = wait(attempts, return_when=FIRST_COMPLETED)
+        for future in done:
+            attempts.remove(future)
+            if future.exception() is None:
+                for other in attempts:
+                    other.cancel()
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+def _session_get(url, params=None, verify=True, headers=None):
+    """SESSION.get bounded by the request timeout and current deadline, hedged when HEDGE_DELAY is set"""
+    def get():
+        try:
+            return SESSION.get(url, params=params, verify=verify, headers=headers, timeout=_timeout())
+        except requests.exceptions.Timeout:
+            raise JockBotNHLTimeout(f"NHL API request timed out | url: {url}")
+    if HEDGE_DELAY is None:
+        return get()
+    return _hedged(get, HEDGE_DELAY)
+
+
+def _cache_ttl(url):
+    """Return the cache TTL for a url, 0 for urls that should not be cached"""
+    for pattern, ttl in CONFIG['cache_ttl'].items():
+        if pattern in url:
+            return ttl
+    return None
+
+
+def _cached(key, func):
+    """Serve func's result from the shared cache when one is configured.
+    Inside _refreshing the result is always fetched and written to the cache
+    """
+    ttl = _cache_ttl(key)
+    if CACHE is None or ttl == 0:
+        return func()
+    if REFRESH.get():
+        value = func()
+        CACHE.set(key, value, ttl)
+        return value
+    return CACHE.fetch(key, func, ttl)
 
 
 def _api_request(endpoint, base_url=None, verify=True):
@@ -37,16 +174,21 @@ def _api_request(endpoint, base_url=None, verify=True):
     if not base_url:
         base_url = 'https://statsapi.web.nhl.com/api/v1/'
     url = f"{base_url}{endpoint}"
+    return _cached(url, lambda: _get(url, verify))
+
+
+def _get(url, verify=True):
+    """GET a url and return the decoded JSON"""
     retries = Retry(total=5, backoff_factor=1, status_forcelist=[x for x in range(500, 506)])
     SESSION.mount('http://', HTTPAdapter(max_retries=retries))
     try:
-        request = SESSION.get(url, verify=verify)
+        request = _session_get(url, verify=verify)
     except socket.gaierror:
-        time.sleep(1)
-        request = SESSION.get(url)
+        _sleep(1)
+        request = _session_get(url)
     except requests.exceptions.ConnectionError:
-        time.sleep(2)
-        request = SESSION.get(url)
+        _sleep(2)
+        request = _session_get(url)
     if request.status_code != 200:
         error_message = f"Error with NHL API request | status: {request.status_code}\nurl: {url}\n{request.content}"
         logging.error(error_message)
@@ -56,22 +198,59 @@ def _api_request(endpoint, base_url=None, verify=True):
     return data
 
 
+def _conditional_request(endpoint, etag=None, last_modified=None, base_url=None):
+    """Conditional GET request to NHL API that skips the shared cache.
+    Return tuple of data (None when unchanged since etag/last_modified), etag and last modified
+    """
+    if not base_url:
+        base_url = 'https://statsapi.web.nhl.com/api/v1/'
+    url = f"{base_url}{endpoint}"
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    retries = Retry(total=5, backoff_factor=1, status_forcelist=[x for x in range(500, 506)])
+    SESSION.mount('http://', HTTPAdapter(max_retries=retries))
+    try:
+        request = _session_get(url, headers=headers)
+    except socket.gaierror:
+        _sleep(1)
+        request = _session_get(url, headers=headers)
+    except requests.exceptions.ConnectionError:
+        _sleep(2)
+        request = _session_get(url, headers=headers)
+    if request.status_code == 304:
+        return None, etag, last_modified
+    if request.status_code != 200:
+        error_message = f"Error with NHL API request | status: {request.status_code}\nurl: {url}\n{request.content}"
+        logging.error(error_message)
+        raise JockBotNHLException(error_message)
+    return request.json(), request.headers.get('ETag'), request.headers.get('Last-Modified')
+
+
 def _napi_request(base_url=None, params=None, verify=True):
     """
     GET request to NHL API
     """
     if not base_url:
         base_url = 'https://statsapi.web.nhl.com/api/v1/'
+    key = f"{base_url}?{json.dumps(params, sort_keys=True)}"
+    return _cached(key, lambda: _get_params(base_url, params, verify))
+
+
+def _get_params(base_url, params=None, verify=True):
+    """GET a url with query params and return the decoded JSON"""
     retries = Retry(total=3, backoff_factor=1, status_forcelist=[x for x in range(500, 506)])
     SESSION.mount('http://', HTTPAdapter(max_retries=retries))
     try:
-        request = SESSION.get(base_url, params=params, verify=verify)
+        request = _session_get(base_url, params=params, verify=verify)
     except socket.gaierror:
-        time.sleep(1)
-        request = SESSION.get(request.url)
+        _sleep(1)
+        request = _session_get(base_url, params=params)
     except requests.exceptions.ConnectionError:
-        time.sleep(2)
-        request = SESSION.get(request.url)
+        _sleep(2)
+        request = _session_get(base_url, params=params)
     if request.status_code != 200:
         error_message = [
             f"Error with NHL API request | status: {request.status_code}",
@@ -121,17 +300,77 @@ def _games_on_date(date):
         return games
 
 
+def _today():
+    """Return the current date in US/Eastern, the time zone the NHL schedule runs on"""
+    return datetime.datetime.now(timezone('US/Eastern')).date()
+
+
+def _games_on_dates(start_date, end_date):
+    """Get NHL games with linescores for a range of dates in a single request.
+    Return dict of date to games in the same shape as _games_on_date
+    """
+    endpoint = f"schedule?startDate={start_date}&endDate={end_date}&expand=schedule.linescore"
+    data = _api_request(endpoint)
+    slates = {}
+    for date in data['dates']:
+        slates[date['date']] = {'date': date['date'], 'games': date['games']}
+    return slates
+
+
+class _SlateCache:
+    """Date keyed cache of game slates. Yesterday, today and tomorrow are
+    fetched together and refetched when the Eastern date rolls over or the
+    slates expire; ttl applies while games are live, idle_ttl otherwise
+    """
+    def __init__(self, ttl=30, idle_ttl=600):
+        self.ttl = ttl
+        self.idle_ttl = idle_ttl
+        self.slates = {}
+        self.day = None
+        self.fetched = 0
+        self.lock = threading.Lock()
+
+    def _expired(self, today):
+        if self.day != today:
+            return True
+        live = self.slates.get(str(today))
+        live = live and any(g['status']['abstractGameState'] == 'Live' for g in live['games'])
+        ttl = self.ttl if live else self.idle_ttl
+        return time.time() - self.fetched > ttl
+
+    def games(self, date):
+        """Return the slate for a date, None if no games are scheduled"""
+        today = _today()
+        with self.lock:
+            if self._expired(today):
+                one_day = datetime.timedelta(1)
+                self.slates = _games_on_dates(today - one_day, today + one_day)
+                self.day = today
+                self.fetched = time.time()
+            slate = self.slates.get(str(date))
+        if slate is None and abs((date - today).days) > 1:
+            slate = _games_on_date(date)
+        return slate
+
+
+SLATES = _SlateCache()
+
+
 def _todays_games():
     """Get NHL games being played today"""
-    date = datetime.datetime.strftime(DATE, "%Y-%m-%d")
-    games = _games_on_date(date)
+    games = SLATES.games(_today())
+    return games
+
+
+def _tomorrows_games():
+    """Get NHL games being played tomorrow"""
+    games = SLATES.games(_today() + datetime.timedelta(1))
     return games
 
 
 def _recent_games():
     """Get games played yesterday"""
-    date = (DATE - datetime.timedelta(1)).strftime('%Y-%m-%d')
-    games = _games_on_date(date)
+    games = SLATES.games(_today() - datetime.timedelta(1))
     return games
 
 
@@ -151,6 +390,8 @@ def _standings(records=False):
             standings['records'][name]['record'] = team['leagueRecord']
             standings['records'][name]['games_played'] = team['gamesPlayed']
             standings['records'][name]['points'] = team['points']
+            standings['records'][name]['regulation_wins'] = team.get('regulationWins', 0)
+            standings['records'][name]['row'] = team.get('row', 0)
     if records:
         return standings['records']
     return standings
@@ -191,32 +432,112 @@ def _parse_schedule(schedule):
     unplayed_games = []
     Games = namedtuple('Games', ['played', 'unplayed'])
     for game in schedule:
-        game_data = {'away_team': {}, 'home_team': {}}
-        game_info = game['games'][0]
-        status = game_info['status']['abstractGameState']
-        teams = game_info['teams']
-        if game_info['gameType'] != 'PR' and status == 'Final':
-            game_data['date'] = game['date']
-            game_data['away_team']['name'] = teams['away']['team']['name']
-            game_data['away_team']['score'] = teams['away']['score']
-            game_data['home_team']['name'] = teams['home']['team']['name']
-            game_data['home_team']['score'] = teams['home']['score']
-            completed_games.append(game_data)
-        elif game_info['gameType'] != 'PR' and status == 'Preview':
-            game_data['date'] = game['date']
-            game_data['away_team']['name'] = teams['away']['team']['name']
-            game_data['home_team']['name'] = teams['home']['team']['name']
-            unplayed_games.append(game_data)
+        for game_info in game['games']:
+            game_data = {'away_team': {}, 'home_team': {}}
+            status = game_info['status']['abstractGameState']
+            teams = game_info['teams']
+            if game_info['gameType'] != 'PR' and status == 'Final':
+                game_data['date'] = game['date']
+                game_data['away_team']['name'] = teams['away']['team']['name']
+                game_data['away_team']['score'] = teams['away']['score']
+                game_data['home_team']['name'] = teams['home']['team']['name']
+                game_data['home_team']['score'] = teams['home']['score']
+                completed_games.append(game_data)
+            elif game_info['gameType'] != 'PR' and status == 'Preview':
+                game_data['date'] = game['date']
+                game_data['away_team']['name'] = teams['away']['team']['name']
+                game_data['home_team']['name'] = teams['home']['team']['name']
+                unplayed_games.append(game_data)
     games = Games(played=completed_games, unplayed=unplayed_games)
     return games
 
 
+def _league_schedule(season, game_type='R'):
+    """Get the full league schedule for a season. Return list of dates with games
+    game_type None returns every game type, like a team schedule does
+    """
+    endpoint = f"schedule?season={season}"
+    if game_type:
+        endpoint = f"{endpoint}&gameType={game_type}"
+    data = _api_request(endpoint)
+    return data['dates']
+
+
 def _get_linescore(game_id):
     endpoint = f"game/{game_id}/linescore"
     data = _api_request(endpoint)
     return data
 
 
+def _game_feed(game_id):
+    """Get the full live feed for a game"""
+    endpoint = f"game/{game_id}/feed/live"
+    data = _api_request(endpoint)
+    return data
+
+
+def _game_feed_diff(game_id, timecode):
+    """Get the list of diffs to a game's live feed since a timecode"""
+    endpoint = f"game/{game_id}/feed/live/diffPatch?startTimecode={timecode}"
+    data = _api_request(endpoint)
+    return data
+
+
+def _json_pointer(path):
+    """Split a JSON pointer into its unescaped reference tokens"""
+    if not path:
+        return []
+    return [token.replace('~1', '/').replace('~0', '~') for token in path.split('/')[1:]]
+
+
+def _resolve_pointer(document, tokens):
+    """Walk a document along reference tokens. Return the target container"""
+    for token in tokens:
+        document = document[int(token)] if isinstance(document, list) else document[token]
+    return document
+
+
+def _apply_patch(document, operations):
+    """Apply a list of JSON patch operations to a document in place. Return the document"""
+    for operation in operations:
+        op = operation['op']
+        tokens = _json_pointer(operation['path'])
+        if op in ('move', 'copy'):
+            source = _json_pointer(operation['from'])
+            value = _resolve_pointer(document, source)
+            if op == 'move':
+                _apply_patch(document, [{'op': 'remove', 'path': operation['from']}])
+            else:
+                value = json.loads(json.dumps(value))
+            op, operation = 'add', {'path': operation['path'], 'value': value}
+        if not tokens:
+            if op == 'test':
+                if document != operation['value']:
+                    raise JockBotNHLException('Game feed patch test failed at document root')
+                continue
+            document = operation.get('value')
+            continue
+        parent = _resolve_pointer(document, tokens[:-1])
+        key = tokens[-1]
+        if isinstance(parent, list):
+            key = len(parent) if key == '-' else int(key)
+        if op == 'add':
+            if isinstance(parent, list):
+                parent.insert(key, operation['value'])
+            else:
+                parent[key] = operation['value']
+        elif op == 'replace':
+            parent[key] = operation['value']
+        elif op == 'remove':
+            del parent[key]
+        elif op == 'test':
+            if parent[key] != operation['value']:
+                raise JockBotNHLException(f"Game feed patch test failed at {operation['path']}")
+        else:
+            raise JockBotNHLException(f"Invalid patch operation: {op}")
+    return document
+
+
 def _game_scores(status, games=None, linescore=False):
     """Parse game scores"""
     game_scores = []
@@ -230,7 +551,7 @@ def _game_scores(status, games=None, linescore=False):
         teams = game['teams']
         if linescore:
             game_id = game['gamePk']
-            game_data['linescore'] = _get_linescore(game_id)
+            game_data['linescore'] = game.get('linescore') or _get_linescore(game_id)
             current_period = game_data['linescore'].get('currentPeriodOrdinal')
             time_left = game_data['linescore'].get('currentPeriodTimeRemaining')
             game_data['period'] = current_period
@@ -282,34 +603,44 @@ def _fetch_league_leaders(stat, player_type, season=None, season_type='2', num_p
     return leaders[:num_players]
 
 
-def _fetch_league_leaders_teams(stat, season=None, season_type='2', reverse=False):
-    """Fetch team stat leaders
+def _fetch_season_summary(player_type, season=None, season_type='2'):
+    """Fetch the full season summary for every skater or goalie in a single request
+    PARAMS
+    :player_type: skater or goalie
+    :season: str ex. '20182019'  (defaults to current season)
+    :season_type: 2 for regular season (default) 3 for playoffs
+    """
+    if player_type != 'skater' and player_type != 'goalie':
+        raise JockBotNHLException(f"Invalid player_type: {player_type}")
+    base_url = f"http://www.nhl.com/stats/rest/{player_type}s"
+    season = _current_season() if not season else season
+    params = {
+        "reportType": "season",
+        "reportName": f"{player_type}summary",
+        "cayenneExp": f"seasonId={season} and gameTypeId={season_type}"
+    }
+    summary = _napi_request(base_url=base_url, params=params, verify=False)['data']
+    return summary
+
+
+def _fetch_team_summary(season=None, season_type='2'):
+    """Fetch the full team summary with every stat for every team in a single request
     PARAMS
-    :stat: stat to retrieve leaders for
     :season: str ex. '20182019'  (defaults to current season)
     :season_type: 2 for regular season (default) 3 for playoffs
-    :reverse: reverse the order of results
     """
     base_url = f"{CONFIG['urls']['nhle']}team"
     season = _current_season() if not season else season
     query = f"leagueId=133 and gameTypeId={season_type} and seasonId>={season} and seasonId<={season}"
-    sort = {
-        "property": stat,
-        "direction": "DESC"
-    }
-    sort = str(sort).replace('\'', '\"')
     params = {
         "isAggregate": "false",
         "reportType": "basic",
         "isGame": "false",
         "reportName": "teamsummary",
-        "sort": sort,
         "cayenneExp": query
     }
-    leaders = _napi_request(base_url=base_url, params=params)['data']
-    if reverse:
-        leaders.reverse()
-    return leaders
+    summary = _napi_request(base_url=base_url, params=params)['data']
+    return summary
 
 
 def _parse_leaders(stat, player_type, **kwargs):
@@ -325,16 +656,6 @@ def _parse_leaders(stat, player_type, **kwargs):
     return leaders
 
 
-def _parse_leaders_teams(stat, **kwargs):
-    """Parse stats for league leaders"""
-    leaders = OrderedDict()
-    leaders_list = _fetch_league_leaders_teams(stat, **kwargs)
-    for leader in leaders_list:
-        name = leader['teamFullName']
-        leaders[name] = leader[stat]
-    return leaders
-
-
 def _current_season():
     """Return the current NHL season"""
     endpoint = "seasons/current"
@@ -357,11 +678,14 @@ def _current_season_start_date():
         raise JockBotNHLException('Unable to retrieve current NHL start date')
 
 
-def _filter_stats_check():
+def _filter_stats_check(season_start=None):
     """Check if the regular season is over 30 days old
     if True stats should be filtered based players time on ice
+    PARAMS
+    :season_start: regular season start date ex. '2019-10-02' (fetched when not provided)
     """
-    season_start = datetime.datetime.strptime(_current_season_start_date(), '%Y-%m-%d')
+    season_start = _current_season_start_date() if not season_start else season_start
+    season_start = datetime.datetime.strptime(season_start, '%Y-%m-%d')
     filter_date = (season_start + datetime.timedelta(30))
     date = datetime.datetime.now()
     if date > filter_date:
@@ -419,9 +743,9 @@ def _all_player_ids():
     return player_ids
 
 
-def _player_id(player):
+def _player_id(player, players=None):
     """Lookup and return the NHL API player ID for an idividual player"""
-    players = _all_player_ids()
+    players = _all_player_ids() if not players else players
     player_id = players.get(player)
     if not player:
         raise JockBotNHLException(f"Player Not Found {player}")
@@ -0,0 +1,153 @@
+import numpy as np
+
+from collections import OrderedDict
+
+
+class _SeasonSummary:
+    """Season summary rows held as columnar arrays so leaders for any
+    number of stats can be computed from a single download
+    """
+    def __init__(self, rows, name_key='playerName', team_key='playerTeamsPlayedFor'):
+        self.rows = rows
+        self.name_key = name_key
+        self.team_key = team_key
+        self._columns = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def column(self, stat):
+        """Return a float array of a stat for every row, NaN where the stat is missing"""
+        if stat not in self._columns:
+            values = [row.get(stat) for row in self.rows]
+            self._columns[stat] = np.array([np.nan if v is None else v for v in values], dtype=float)
+        return self._columns[stat]
+
+    def time_on_ice(self):
+        """Total seconds of ice time for every row"""
+        if self.rows and 'timeOnIce' in self.rows[0]:
+            return self.column('timeOnIce')
+        return self.column('timeOnIcePerGame') * self.column('gamesPlayed')
+
+    def mask(self, time_filter=0, min_games=0, team=None, where=None):
+        """Build a boolean mask of rows passing every filter
+        PARAMS
+        :time_filter: minimum seconds of ice time
+        :min_games: minimum games played
+        :team: team abbreviation the player must have played for. ex. 'BOS'
+        :where: callable taking this summary and returning a boolean mask
+        """
+        mask = np.ones(len(self.rows), dtype=bool)
+        if time_filter:
+            mask &= self.time_on_ice() > time_filter
+        if min_games:
+            mask &= self.column('gamesPlayed') >= min_games
+        if team:
+            team = team.upper()
+            mask &= np.array([
+                team in [t.strip() for t in (row.get(self.team_key) or '').split(',')]
+                for row in self.rows
+            ], dtype=bool)
+        if where is not None:
+            mask &= np.asarray(where(self), dtype=bool)
+        return mask
+
+    def top(self, stat, num=10, reverse=True, mask=None):
+        """Return row indices of the top num values of a stat using a partial sort"""
+        values = self.column(stat)
+        candidates = np.flatnonzero(~np.isnan(values) if mask is None else mask & ~np.isnan(values))
+        keys = -values[candidates] if reverse else values[candidates]
+        if num < len(candidates):
+            partition = np.argpartition(keys, num - 1)[:num]
+            candidates, keys = candidates[partition], keys[partition]
+        return candidates[np.argsort(keys, kind='stable')]
+
+    def _leaders(self, stat, num_players, reverse, mask):
+        leaders = OrderedDict()
+        for i in self.top(stat, num_players, reverse, mask):
+            row = self.rows[i]
+            leaders[row[self.name_key]] = {'team': row.get(self.team_key), 'value': row[stat]}
+        return leaders
+
+    def leaders(self, stat, num_players=10, reverse=True, **filters):
+        """Return an OrderedDict of leaders for a stat in the same shape as _parse_leaders"""
+        return self._leaders(stat, num_players, reverse, self.mask(**filters))
+
+    def leaderboards(self, stats, num_players=10, reverse=True, **filters):
+        """Return leaders for many stats at once. stats may be a list or a dict of stat to reverse"""
+        if not isinstance(stats, dict):
+            stats = OrderedDict((stat, reverse) for stat in stats)
+        mask = self.mask(**filters)
+        boards = OrderedDict()
+        for stat, stat_reverse in stats.items():
+            boards[stat] = self._leaders(stat, num_players, stat_reverse, mask)
+        return boards
+
+
+# Team stats where the lowest value ranks first
+LOWER_IS_BETTER = (
+    'goalsAgainst',
+    'goalsAgainstPerGame',
+    'losses',
+    'otLosses',
+    'shotsAgainstPerGame'
+)
+
+
+class _TeamStatsMatrix:
+    """Every team by every numeric stat from a single team summary download,
+    with ranks and percentiles for all stats computed at once
+    """
+    def __init__(self, rows, lower_is_better=LOWER_IS_BETTER):
+        self.rows = rows
+        self.teams = [row['teamFullName'] for row in rows]
+        self.team_ids = [row['teamId'] for row in rows]
+        self.stats = sorted({
+            stat for row in rows for stat, value in row.items()
+            if stat not in ('teamId', 'seasonId') and isinstance(value, (int, float)) and not isinstance(value, bool)
+        })
+        self.values = np.array(
+            [[np.nan if row.get(stat) is None else row[stat] for stat in self.stats] for row in rows],
+            dtype=float
+        ).reshape(len(rows), len(self.stats))
+        # Flip stats where lower is better so larger is always better when ranking
+        sign = np.array([-1.0 if stat in lower_is_better else 1.0 for stat in self.stats])
+        missing = np.isnan(self.values)
+        signed = np.where(missing, -np.inf, self.values * sign)
+        better = signed[None, :, :] > signed[:, None, :]
+        worse = (signed[None, :, :] < signed[:, None, :]) & ~missing[None, :, :]
+        self.ranks = better.sum(axis=1) + 1.0
+        self.percentiles = 100.0 * worse.sum(axis=1) / np.maximum((~missing).sum(axis=0) - 1, 1)
+        self.ranks[missing] = np.nan
+        self.percentiles[missing] = np.nan
+        self._stat_index = {stat: i for i, stat in enumerate(self.stats)}
+        self._team_index = {team_id: i for i, team_id in enumerate(self.team_ids)}
+
+    def column(self, stat):
+        """Return a stat for every team"""
+        return self.values[:, self._stat_index[stat]]
+
+    def leaders(self, stat, descending=True):
+        """Return an OrderedDict of team name to stat value sorted by the stat, missing values last"""
+        values = self.column(stat)
+        keys = -values if descending else values
+        order = np.argsort(np.where(np.isnan(keys), np.inf, keys), kind='stable')
+        return OrderedDict((self.teams[i], self.rows[i].get(stat)) for i in order)
+
+    def _team_row(self, matrix, team_id):
+        i = self._team_index[team_id]
+        return OrderedDict((stat, None if np.isnan(v) else float(v)) for stat, v in zip(self.stats, matrix[i]))
+
+    def team(self, team_id):
+        """Return every stat for a team"""
+        i = self._team_index[team_id]
+        return OrderedDict((stat, self.rows[i].get(stat)) for stat in self.stats)
+
+    def team_ranks(self, team_id):
+        """Return a team's league rank in every stat, 1 is best"""
+        ranks = self._team_row(self.ranks, team_id)
+        return OrderedDict((stat, None if rank is None else int(rank)) for stat, rank in ranks.items())
+
+    def team_percentiles(self, team_id):
+        """Return the percentage of teams a team is better than in every stat"""
+        return self._team_row(self.percentiles, team_id)
@@ -0,0 +1,120 @@
+import numpy as np
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+# Share of games that go past regulation, and of those the share decided in a shootout
+OT_RATE = 0.23
+SHOOTOUT_RATE = 0.4
+HOME_ICE = 0.03
+DIVISION_SPOTS = 3
+WILDCARD_SPOTS = 2
+CHUNK_SIZE = 2000
+
+
+def _team_strength(records, teams):
+    """Return each team's points percentage, 0.5 for teams yet to play"""
+    strength = np.full(len(teams), 0.5)
+    for i, team in enumerate(teams):
+        games_played = records[team]['games_played']
+        if games_played:
+            strength[i] = records[team]['points'] / (2 * games_played)
+    return np.clip(strength, 0.05, 0.95)
+
+
+def _home_win_probability(strength, home, away):
+    """Log5 probability of the home team winning each game, adjusted for home ice"""
+    home_strength = strength[home]
+    away_strength = strength[away]
+    numerator = home_strength * (1 - away_strength)
+    probability = numerator / (numerator + away_strength * (1 - home_strength))
+    return np.clip(probability + HOME_ICE, 0.01, 0.99)
+
+
+def _simulate_chunk(args):
+    """Simulate a chunk of seasons. Return the number of times each team made the playoffs
+
+    Every simulated season is a row, every team a column; all remaining games
+    of all seasons in the chunk are drawn at once and tallied with bincount.
+    """
+    base, home, away, p_home, divisions, conferences, simulations, seed = args
+    rng = np.random.default_rng(seed)
+    num_teams = base.shape[1]
+    num_games = len(home)
+    rows = np.arange(simulations)[:, None]
+    offsets = rows * num_teams
+    home_win = rng.random((simulations, num_games)) < p_home
+    extra_time = rng.random((simulations, num_games)) < OT_RATE
+    shootout = extra_time & (rng.random((simulations, num_games)) < SHOOTOUT_RATE)
+    winner = (np.where(home_win, home, away) + offsets).ravel()
+    loser = (np.where(home_win, away, home) + offsets).ravel()
+    size = simulations * num_teams
+
+    def tally(index, weights=None):
+        return np.bincount(index, weights=weights, minlength=size).reshape(simulations, num_teams)
+
+    wins = tally(winner)
+    points = 2 * wins + tally(loser, extra_time.ravel())
+    regulation_wins = tally(winner, (~extra_time).ravel())
+    row = tally(winner, (~shootout).ravel())
+    # Tiebreakers in NHL order: points, regulation wins, ROW, wins, then a coin flip
+    key = (base[0] + points) * 1e9
+    key += (base[1] + regulation_wins) * 1e6
+    key += (base[2] + row) * 1e3
+    key += base[3] + wins
+    key += rng.random((simulations, num_teams))
+    qualified = np.zeros((simulations, num_teams), dtype=bool)
+    for division in divisions:
+        top = np.argsort(-key[:, division], axis=1)[:, :DIVISION_SPOTS]
+        qualified[rows, division[top]] = True
+    for conference in conferences:
+        remaining = np.where(qualified[:, conference], -np.inf, key[:, conference])
+        top = np.argsort(-remaining, axis=1)[:, :WILDCARD_SPOTS]
+        qualified[rows, conference[top]] = True
+    return qualified.sum(axis=0)
+
+
+def _playoff_odds(records, divisions, conferences, remaining_games, simulations=100000, processes=None, seed=None):
+    """Monte Carlo simulation of the remaining schedule. Return playoff odds for each team
+    PARAMS
+    :records: team records as returned by _standings(records=True)
+    :divisions: dict of division name to team names
+    :conferences: dict of conference name to team names
+    :remaining_games: unplayed games as returned by _parse_schedule
+    :simulations: number of seasons to simulate (default is 100000)
+    :processes: number of worker processes to spread the simulations across
+    :seed: seed for reproducible results
+    """
+    teams = sorted(records)
+    index = {team: i for i, team in enumerate(teams)}
+    games = [
+        (index[game['home_team']['name']], index[game['away_team']['name']])
+        for game in remaining_games
+        if game['home_team']['name'] in index and game['away_team']['name'] in index
+    ]
+    home = np.array([game[0] for game in games], dtype=np.intp)
+    away = np.array([game[1] for game in games], dtype=np.intp)
+    p_home = _home_win_probability(_team_strength(records, teams), home, away)
+    base = np.array([
+        [records[team]['points'] for team in teams],
+        [records[team].get('regulation_wins', 0) for team in teams],
+        [records[team].get('row', 0) for team in teams],
+        [records[team]['record']['wins'] for team in teams]
+    ], dtype=float)
+    division_index = [np.array([index[t] for t in div if t in index]) for div in divisions.values()]
+    conference_index = [np.array([index[t] for t in conf if t in index]) for conf in conferences.values()]
+    sizes = [CHUNK_SIZE] * (simulations // CHUNK_SIZE)
+    if simulations % CHUNK_SIZE:
+        sizes.append(simulations % CHUNK_SIZE)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    chunks = [
+        (base, home, away, p_home, division_index, conference_index, size, chunk_seed)
+        for size, chunk_seed in zip(sizes, seeds)
+    ]
+    if processes and processes > 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            counts = sum(executor.map(_simulate_chunk, chunks))
+    else:
+        counts = sum(map(_simulate_chunk, chunks))
+    odds = {team: float(counts[index[team]]) / simulations for team in teams}
+    return OrderedDict(sorted(odds.items(), key=lambda t: t[1], reverse=True))
@@ -0,0 +1,155 @@
+import datetime
+import logging
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from jockbot_nhl import _helpers
+from jockbot_nhl._helpers import JockBotNHLException, SLATES, _api_request, _refreshing, _todays_games
+from jockbot_nhl.nhl import NHL, _refresh_sections
+
+
+def _game_start(game):
+    """Return a game's scheduled start as a unix timestamp"""
+    start = datetime.datetime.strptime(game['gameDate'], '%Y-%m-%dT%H:%M:%SZ')
+    return start.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+def _warm_roster(team_id):
+    """Refetch the roster NHLTeam reads into the shared cache and any loaded snapshot rosters"""
+    with _refreshing():
+        roster = _api_request(f"teams/{team_id}/roster?season={NHL.current_season}")['roster']
+    if NHL.rosters:
+        NHL.rosters[team_id] = roster
+
+
+def _warm_team_stats(team_id):
+    """Refetch team stats into the shared cache through the same call NHLTeam makes"""
+    with _refreshing():
+        NHL().get_team_stats(team_id=team_id)
+
+
+def _log_error(future):
+    error = future.exception()
+    if error:
+        logging.error(f"Prefetch error: {error}")
+
+
+class PrefetchScheduler:
+    """
+    Warm standings, rosters and team stats from today's schedule: lead_time
+    seconds before each puck drop and as soon as each game is final.
+    Warm-ups always fetch from the NHL API and overwrite the shared cache.
+    Standings are refreshed on the NHL class, rosters and team stats are
+    warmed in the shared cache, so one must be configured with set_cache or
+    JOCKBOT_NHL_CACHE. Keep lead_time below the cache TTL.
+    Runs in a background thread with at most max_workers requests in flight
+    and at most budget requests per budget_window seconds
+    """
+    def __init__(self, lead_time=240, poll_interval=60, max_workers=4, budget=600, budget_window=3600):
+        if _helpers.CACHE is None:
+            raise JockBotNHLException('PrefetchScheduler needs a shared cache, see set_cache')
+        self.lead_time = lead_time
+        self.poll_interval = poll_interval
+        self.max_workers = max_workers
+        self.budget = budget
+        self.budget_window = budget_window
+        self.day = None
+        self.done = set()
+        self.spent = deque()
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = None
+
+    def _spend(self, cost):
+        """Reserve requests from the budget. Return False if the budget is exhausted"""
+        now = time.time()
+        while self.spent and now - self.spent[0] > self.budget_window:
+            self.spent.popleft()
+        if len(self.spent) + cost > self.budget:
+            return False
+        self.spent.extend([now] * cost)
+        return True
+
+    def _submit(self, tasks):
+        """Submit (cost, func, args) tasks that fit in the budget. Return list of futures"""
+        futures = []
+        for cost, func, args in tasks:
+            if not self._spend(cost):
+                logging.warning(f"Prefetch budget exhausted, skipping {func.__name__}{args}")
+                continue
+            future = self._executor.submit(func, *args)
+            future.add_done_callback(_log_error)
+            futures.append(future)
+        return futures
+
+    def _game_tasks(self, game, phase):
+        team_ids = [game['teams'][side]['team']['id'] for side in ('away', 'home')]
+        tasks = [(1, _warm_team_stats, (team_id,)) for team_id in team_ids]
+        if phase == 'pregame':
+            tasks += [(1, _warm_roster, (team_id,)) for team_id in team_ids]
+        return tasks
+
+    def run_once(self, now=None):
+        """Queue warm-ups for every game that is about to start or has just finished.
+        Return list of futures
+        """
+        now = time.time() if now is None else now
+        slate = _todays_games()
+        if slate and slate['date'] != self.day:
+            self.day = slate['date']
+            self.done.clear()
+        tasks = []
+        for game in slate['games'] if slate else []:
+            status = game['status']['abstractGameState']
+            if status == 'Final':
+                phase = 'final'
+            elif status == 'Preview' and now >= _game_start(game) - self.lead_time:
+                phase = 'pregame'
+            else:
+                continue
+            if (game['gamePk'], phase) in self.done:
+                continue
+            self.done.add((game['gamePk'], phase))
+            tasks += self._game_tasks(game, phase)
+        if tasks:
+            # Standings are league wide, refresh them once per pass
+            tasks.insert(0, (4, _refresh_sections, (['standings'],)))
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        return self._submit(tasks)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as error:
+                logging.error(f"Prefetch error: {error}")
+            self._stop.wait(self._poll_delay())
+
+    def _poll_delay(self):
+        """Poll faster while games are live so finals are caught quickly"""
+        slate = SLATES.slates.get(str(SLATES.day))
+        if slate and any(g['status']['abstractGameState'] == 'Live' for g in slate['games']):
+            return min(self.poll_interval, SLATES.ttl)
+        return self.poll_interval
+
+    def start(self):
+        """Start prefetching in a background thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._thread = threading.Thread(target=self._run, name='jockbot-nhl-prefetch', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread and wait for queued warm-ups"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        if self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
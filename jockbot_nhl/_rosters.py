@@ -0,0 +1,103 @@
+import logging
+import threading
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from jockbot_nhl._helpers import CONFIG, JockBotNHLException, _conditional_request
+from jockbot_nhl.nhl import NHL
+
+RosterChanges = namedtuple('RosterChanges', ['version', 'added', 'removed', 'moved', 'changed'])
+
+
+class RosterTracker:
+    """
+    Keep a versioned local copy of every roster and report call-ups, trades
+    and moves between refreshes. Rosters are refreshed in parallel with
+    conditional requests so unchanged rosters cost a 304. players maps
+    lowercase player names to NHL API player IDs for every rostered player
+    and is updated in place. Newly rostered players are also added to a
+    loaded NHL.player_index so name lookups find call-ups
+    """
+    def __init__(self, max_workers=8, team_ids=None):
+        self.max_workers = max_workers
+        self.team_ids = list(CONFIG['full_team_names'].values()) if not team_ids else team_ids
+        self.rosters = {}
+        self.players = {}
+        self.player_teams = {}
+        self.lock = threading.Lock()
+
+    def _fetch(self, team_id):
+        """Fetch a roster unless unchanged. Return dict of player ID to roster entry or None"""
+        current = self.rosters.get(team_id, {})
+        data, etag, last_modified = _conditional_request(
+            f"teams/{team_id}/roster",
+            etag=current.get('etag'),
+            last_modified=current.get('last_modified')
+        )
+        if data is None:
+            return None, etag, last_modified
+        players = {player['person']['id']: player for player in data.get('roster', [])}
+        return players, etag, last_modified
+
+    def refresh(self, team_ids=None):
+        """Refresh rosters in parallel. Return dict of team ID to RosterChanges for teams that changed"""
+        team_ids = self.team_ids if not team_ids else team_ids
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {team_id: executor.submit(self._fetch, team_id) for team_id in team_ids}
+            for team_id, future in futures.items():
+                # A failed team keeps its previous roster and is retried on the next refresh
+                try:
+                    results[team_id] = future.result()
+                except (JockBotNHLException, requests.exceptions.RequestException) as error:
+                    logging.error(f"Roster refresh failed for team {team_id}: {error}")
+        with self.lock:
+            return self._apply(results)
+
+    def _apply(self, results):
+        added, removed, changed = {}, {}, {}
+        for team_id, (players, etag, last_modified) in results.items():
+            roster = self.rosters.setdefault(team_id, {'version': 0, 'players': {}})
+            roster['etag'], roster['last_modified'] = etag, last_modified
+            if players is None:
+                continue
+            old = roster['players']
+            added[team_id] = [players[i] for i in players.keys() - old.keys()]
+            removed[team_id] = [old[i] for i in old.keys() - players.keys()]
+            changed[team_id] = [players[i] for i in players.keys() & old.keys() if players[i] != old[i]]
+            roster['players'] = players
+        # A player added to one roster who was on another is a move, not a call-up
+        moved = {team_id: [] for team_id in added}
+        arrivals = set()
+        for team_id, players in added.items():
+            for player in players:
+                player_id = player['person']['id']
+                from_team = self.player_teams.get(player_id)
+                if from_team is not None and from_team != team_id:
+                    moved[team_id].append((player, from_team))
+                    arrivals.add(player_id)
+                self.player_teams[player_id] = team_id
+                self.players[player['person']['fullName'].lower()] = player_id
+                if NHL.player_index:
+                    NHL.player_index[player['person']['fullName'].lower()] = player_id
+            added[team_id] = [p for p in players if p['person']['id'] not in arrivals]
+        changes = {}
+        for team_id in added:
+            removed[team_id] = [p for p in removed[team_id] if p['person']['id'] not in arrivals]
+            for player in removed[team_id]:
+                player_id = player['person']['id']
+                if self.player_teams.get(player_id) == team_id:
+                    del self.player_teams[player_id]
+                    self.players.pop(player['person']['fullName'].lower(), None)
+            if added[team_id] or removed[team_id] or moved[team_id] or changed[team_id]:
+                roster = self.rosters[team_id]
+                roster['version'] += 1
+                if NHL.rosters:
+                    NHL.rosters[team_id] = list(roster['players'].values())
+                changes[team_id] = RosterChanges(
+                    roster['version'], added[team_id], removed[team_id], moved[team_id], changed[team_id]
+                )
+        return changes
@@ -0,0 +1,105 @@
+import os
+import pickle
+import tempfile
+import time
+import zlib
+
+from collections import OrderedDict
+
+from jockbot_nhl._helpers import (
+    JockBotNHLException,
+    _all_player_ids,
+    _api_request,
+    _current_season,
+    _fetch_standings,
+    _league_schedule,
+    _standings,
+    _wild_card_standings
+)
+
+SNAPSHOT_MAGIC = b'JBNHL'
+SNAPSHOT_VERSION = 1
+
+
+def _standings_section(season):
+    """Everything NHL keeps as league wide class attributes"""
+    standings = _standings()
+    return {
+        'current_season': _current_season(),
+        'standings': standings,
+        'league_standings': _fetch_standings(standings, 'league'),
+        'conference_standings': _fetch_standings(standings, 'conference'),
+        'division_standings': _fetch_standings(standings, 'division'),
+        'wildcard_standings': {
+            'Eastern': _wild_card_standings('eastern'),
+            'Western': _wild_card_standings('western')
+        },
+        'team_records': standings['records']
+    }
+
+
+def _team_info_section(season):
+    """Team info for every team keyed by NHL API team ID"""
+    teams = _api_request('teams')['teams']
+    return {team['id']: team for team in teams}
+
+
+def _rosters_section(season):
+    """Current roster of every team keyed by NHL API team ID, in one request"""
+    teams = _api_request(f"teams?expand=team.roster&season={season}")['teams']
+    return {team['id']: team.get('roster', {}).get('roster', []) for team in teams}
+
+
+def _schedules_section(season):
+    """Season schedule of every team keyed by NHL API team ID, split out of the league schedule.
+    Every game type is included so playoff games match the team schedule endpoint
+    """
+    schedules = {}
+    for date in _league_schedule(season, game_type=None):
+        for game in date['games']:
+            for side in ('away', 'home'):
+                team_id = game['teams'][side]['team']['id']
+                schedules.setdefault(team_id, []).append({'date': date['date'], 'games': [game]})
+    return schedules
+
+
+def _player_index_section(season):
+    return _all_player_ids()
+
+
+SECTIONS = OrderedDict([
+    ('standings', _standings_section),
+    ('team_info', _team_info_section),
+    ('rosters', _rosters_section),
+    ('schedules', _schedules_section),
+    ('player_index', _player_index_section)
+])
+
+
+def _build_section(name, season):
+    """Fetch a section. Return tuple of fetch time and data"""
+    return time.time(), SECTIONS[name](season)
+
+
+def _write_snapshot(path, sections):
+    """Atomically write sections to a compressed snapshot file"""
+    snapshot = {'version': SNAPSHOT_VERSION, 'created': time.time(), 'sections': sections}
+    payload = zlib.compress(pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL))
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(payload)
+    os.replace(tmp, path)
+
+
+def _read_snapshot(path):
+    """Read a snapshot file. Return dict of section name to tuple of fetch time and data"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(SNAPSHOT_MAGIC):
+        raise JockBotNHLException(f"Not a jockbot_nhl snapshot: {path}")
+    snapshot = pickle.loads(zlib.decompress(data[len(SNAPSHOT_MAGIC):]))
+    if snapshot['version'] != SNAPSHOT_VERSION:
+        raise JockBotNHLException(f"Unsupported snapshot version: {snapshot['version']}")
+    return snapshot['sections']
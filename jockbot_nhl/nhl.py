@@ -1,36 +1,85 @@
+import logging
+import threading
+import time
+
 from jockbot_nhl._helpers import (
     CONFIG,
     JockBotNHLException,
     _api_request,
+    _apply_patch,
     _current_season,
+    _current_season_start_date,
+    _deadline,
+    _fetch_season_summary,
     _fetch_standings,
+    _fetch_team_summary,
     _filter_stats_check,
+    _game_feed,
+    _game_feed_diff,
     _game_scores,
-    _parse_leaders,
-    _parse_leaders_teams,
+    _gather,
+    _league_schedule,
     _parse_schedule,
     _player_id,
     _recent_games,
+    _refreshing,
     _standings,
     _team_id,
     _todays_games,
+    _tomorrows_games,
     _wild_card_standings
 )
+from jockbot_nhl._leaders import _SeasonSummary, _TeamStatsMatrix
+from jockbot_nhl._playoffs import _playoff_odds
+from jockbot_nhl._snapshot import SECTIONS, _build_section, _read_snapshot, _write_snapshot
+
+
+_MISSING = object()
+
+
+class _LeagueAttribute:
+    """Class attribute fetched on first access, so importing the package makes
+    no requests. Attributes of a snapshot section are refetched in the
+    background once the section is older than NHL.snapshot_max_age
+    """
+    def __init__(self, func, section=None):
+        self.func = func
+        self.section = section
+        self.value = _MISSING
+
+    def __set_name__(self, owner, name):
+        self.owner = owner
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if self.value is _MISSING:
+            self.value = self.func(self.owner)
+            return self.value
+        value = self.value
+        if self.section:
+            _refresh_if_stale(self.section)
+        return value
 
 
 class NHL:
     """Create NHL object
     ATTRIBUTES:
     current_season
+    current_season_start
     standings
     league_standings
     conference_standings
     division_standings
     team_records
     todays_games
+    tomorrows_games
     recent_games
     live_scores
     recent_scores
+    team_info
+    rosters
+    schedules
+    player_index
 
     METHODS:
     get_team_info()
@@ -40,30 +89,73 @@ class NHL:
     get_player_info()
     get_player_stats()
     get_career_stats()
+    goalie_league_leaders()
+    skater_league_leaders()
+    team_league_leaders()
+    team_stats_matrix()
+    season_summary()
+    league_leaderboards()
+    playoff_odds()
+    export_snapshot()
+    load_snapshot()
     """
     teams = CONFIG['full_team_names']
-    current_season = _current_season()
-    standings = _standings()
-    league_standings = _fetch_standings(standings, 'league')
-    conference_standings = _fetch_standings(standings, 'conference')
-    division_standings = _fetch_standings(standings, 'division')
-    wildcard_standings = {
+    current_season = _LeagueAttribute(lambda cls: _current_season(), 'standings')
+    current_season_start = _LeagueAttribute(lambda cls: _current_season_start_date())
+    standings = _LeagueAttribute(lambda cls: _standings(), 'standings')
+    league_standings = _LeagueAttribute(lambda cls: _fetch_standings(cls.standings, 'league'), 'standings')
+    conference_standings = _LeagueAttribute(lambda cls: _fetch_standings(cls.standings, 'conference'), 'standings')
+    division_standings = _LeagueAttribute(lambda cls: _fetch_standings(cls.standings, 'division'), 'standings')
+    wildcard_standings = _LeagueAttribute(lambda cls: {
         'Eastern': _wild_card_standings('eastern'),
         'Western': _wild_card_standings('western')
-    }
-    team_records = _standings(records=True)
-    todays_games = _todays_games()
-    recent_games = _recent_games()
-    live_scores = _game_scores(status='Live', games=todays_games, linescore=True)
-    recent_scores = _game_scores(status='Final', games=recent_games)
+    }, 'standings')
+    team_records = _LeagueAttribute(lambda cls: cls.standings['records'], 'standings')
+    # Filled from a snapshot, keyed by NHL API team ID
+    team_info = {}
+    rosters = {}
+    schedules = {}
+    player_index = {}
+    snapshot_fetched = {}
+    # Snapshot sections older than this many seconds are refetched in the background on access
+    snapshot_max_age = 3600
+    # Team stats matrices keyed by season and season type, refetched after team_stats_ttl seconds
+    team_stats_matrices = {}
+    team_stats_ttl = 300
+    # Season summaries keyed by player type, season and season type, refetched after season_summary_ttl seconds
+    season_summaries = {}
+    season_summary_ttl = 300
 
     def __repr__(self):
         return f"NHL season {self.current_season}"
 
+    @property
+    def todays_games(self):
+        return _todays_games()
+
+    @property
+    def tomorrows_games(self):
+        return _tomorrows_games()
+
+    @property
+    def recent_games(self):
+        return _recent_games()
+
+    @property
+    def live_scores(self):
+        return _game_scores(status='Live', games=self.todays_games, linescore=True)
+
+    @property
+    def recent_scores(self):
+        return _game_scores(status='Final', games=self.recent_games)
+
     def get_team_info(self, team_id=None, team_name=None):
         """Get general team information"""
         if not team_id:
             team_id = _team_id(team_name)
+        team_info = _snapshot_section('team_info')
+        if team_id in team_info:
+            return team_info[team_id]
         endpoint = f"teams/{team_id}"
         data = _api_request(endpoint)
         if data:
@@ -82,6 +174,9 @@ class NHL:
         """Get team roster. Return list of player objects"""
         team_id = _team_id(team_name) if not team_id else team_id
         season = self.current_season if not season else season
+        rosters = _snapshot_section('rosters') if season == self.current_season else {}
+        if team_id in rosters:
+            return rosters[team_id]
         endpoint = f"teams/{team_id}/roster?season={season}"
         data = _api_request(endpoint)
         player_list = data['roster']
@@ -91,6 +186,10 @@ class NHL:
         """Get team schedule. Return list of game objects"""
         team_id = _team_id(team_name) if not team_id else team_id
         season = self.current_season if not season else season
+        schedules = _snapshot_section('schedules') if season == self.current_season else {}
+        if team_id in schedules:
+            yield from schedules[team_id]
+            return
         endpoint = f"schedule?teamId={team_id}&season={season}"
         data = _api_request(endpoint)
         game_list = data['dates']
@@ -99,7 +198,7 @@ class NHL:
     def get_player_info(self, player_id=None, player_name=None):
         """Get individual stats for a player"""
         if not player_id:
-            player_id = _player_id(player_name)
+            player_id = _player_id(player_name, players=_snapshot_section('player_index'))
         endpoint = f"people/{player_id}"
         data = _api_request(endpoint)
         if data:
@@ -109,7 +208,7 @@ class NHL:
     def get_player_stats(self, player_id=None, player_name=None, season=None):
         """Get individual stats for a player"""
         if not player_id:
-            player_id = _player_id(player_name)
+            player_id = _player_id(player_name, players=_snapshot_section('player_index'))
         player_info = self.get_player_info(player_id)
         player_active = player_info.get('active')
         team = player_info.get('currentTeam')
@@ -130,7 +229,7 @@ class NHL:
     def get_career_stats(self, player_id=None, player_name=None):
         """Get career stats for a player"""
         if not player_id:
-            player_id = _player_id(player_name)
+            player_id = _player_id(player_name, players=_snapshot_section('player_index'))
         stats_endpoint = "stats?stats=yearByYear"
         endpoint = f"people/{player_id}/{stats_endpoint}"
         data = _api_request(endpoint)
@@ -153,11 +252,9 @@ class NHL:
         time_filter: minimum number of seconds of ice time a player must
                      have to qualify as a leader. ex. time_filter=25200
         """
-        if not _filter_stats_check():
-            leaders = _parse_leaders(stat, 'goalie', **kwargs)
-        else:
+        if 'time_filter' not in kwargs and _filter_stats_check(self.current_season_start):
             kwargs['time_filter'] = 25200
-            leaders = _parse_leaders(stat, 'goalie', **kwargs)
+        leaders = self._summary_leaders(stat, 'goalie', **kwargs)
         return leaders
 
     def skater_league_leaders(self, stat, **kwargs):
@@ -172,9 +269,17 @@ class NHL:
         num_players: number of leaders to return. ex. num_players=5
                      (default is 10)
         """
-        leaders = _parse_leaders(stat, 'skater', **kwargs)
+        leaders = self._summary_leaders(stat, 'skater', **kwargs)
         return leaders
 
+    def _summary_leaders(self, stat, player_type, season=None, season_type='2',
+                         num_players=10, reverse=True, time_filter=0):
+        """Leaders for one stat from the cached season summary"""
+        summary = self.season_summary(player_type, season, season_type)
+        if summary.rows and not any(stat in row for row in summary.rows):
+            raise JockBotNHLException(f"Invalid {player_type} stat: {stat}")
+        return summary.leaders(stat, num_players, reverse, time_filter=time_filter)
+
     def team_league_leaders(self, stat, **kwargs):
         """Get league leaders for an individual team stat
         OPTIONAL KEYWORD ARGS:
@@ -183,27 +288,218 @@ class NHL:
 
         season_type: 2 for regular 3 for post season. ex. season_type='3'
                      (default is regular season)
+
+        reverse: lowest values first. ex. reverse=True
+        """
+        matrix = self.team_stats_matrix(kwargs.get('season'), kwargs.get('season_type', '2'))
+        if stat not in matrix.stats:
+            raise JockBotNHLException(f"Invalid team stat: {stat}")
+        leaders = matrix.leaders(stat, descending=not kwargs.get('reverse', False))
+        return leaders
+
+    def team_stats_matrix(self, season=None, season_type='2'):
+        """Get every stat for every team from a single team summary request.
+        Return matrix with values, ranks and percentiles as teams x stats arrays
+        """
+        season = self.current_season if not season else season
+        key = (season, season_type)
+        fetched, matrix = self.team_stats_matrices.get(key, (0, None))
+        if time.time() - fetched > self.team_stats_ttl:
+            matrix = _TeamStatsMatrix(_fetch_team_summary(season, season_type))
+            NHL.team_stats_matrices[key] = (time.time(), matrix)
+        return matrix
+
+    def season_summary(self, player_type='skater', season=None, season_type='2'):
+        """Get every skater or goalie season summary row from a single request.
+        Return summary with stat columns as arrays
+        """
+        season = self.current_season if not season else season
+        key = (player_type, season, season_type)
+        fetched, summary = self.season_summaries.get(key, (0, None))
+        if time.time() - fetched > self.season_summary_ttl:
+            summary = _SeasonSummary(_fetch_season_summary(player_type, season, season_type))
+            NHL.season_summaries[key] = (time.time(), summary)
+        return summary
+
+    def league_leaderboards(self, stats, player_type='skater', season=None, season_type='2',
+                            num_players=10, reverse=True, **filters):
+        """Get league leaders for many skater or goalie stats from a single season summary download
+        stats may be a list of stats or a dict of stat to reverse. ex. {'points': True, 'plusMinus': False}
+
+        OPTIONAL KEYWORD ARGS:
+        player_type: skater or goalie (default is skater)
+
+        season: stat leaders for a given season. ex. season='19881989'
+                (default is current season)
+
+        season_type: 2 for regular 3 for post season. ex. season_type='3'
+                     (default is regular season)
+
+        num_players: number of leaders to return for each stat. ex. num_players=5
+                     (default is 10)
+
+        time_filter: minimum number of seconds of ice time a player must
+                     have to qualify as a leader. ex. time_filter=25200
+
+        min_games: minimum games played to qualify as a leader. ex. min_games=20
+
+        team: only include players who played for a team. ex. team='BOS'
+
+        where: callable taking the season summary and returning a boolean mask.
+               ex. where=lambda s: s.column('shots') > 100
         """
-        leaders = _parse_leaders_teams(stat, **kwargs)
+        season = self.current_season if not season else season
+        if player_type == 'goalie' and 'time_filter' not in filters:
+            if _filter_stats_check(self.current_season_start):
+                filters['time_filter'] = 25200
+        summary = self.season_summary(player_type, season, season_type)
+        leaders = summary.leaderboards(stats, num_players, reverse, **filters)
         return leaders
 
+    def export_snapshot(self, path):
+        """Fetch standings, team info, rosters, schedules and the player index
+        and write them to a single compressed snapshot file
+        """
+        sections = {name: _build_section(name, self.current_season) for name in SECTIONS}
+        for name, (fetched, data) in sections.items():
+            _apply_section(name, data, fetched)
+        _write_snapshot(path, sections)
+
+    @staticmethod
+    def load_snapshot(path, max_age=3600, refresh=True):
+        """Load league state from a snapshot file written by export_snapshot.
+        Sections older than max_age seconds are refetched in a background thread.
+        Return list of stale section names
+        """
+        NHL.snapshot_max_age = max_age
+        now = time.time()
+        stale = []
+        for name, (fetched, data) in _read_snapshot(path).items():
+            _apply_section(name, data, fetched)
+            if now - fetched > max_age:
+                stale.append(name)
+        if stale and refresh:
+            _refresh_in_background(stale)
+        return stale
+
+    def snapshot_ages(self):
+        """Return seconds since each snapshot section was fetched"""
+        now = time.time()
+        return {name: now - fetched for name, fetched in self.snapshot_fetched.items()}
+
+    def playoff_odds(self, simulations=100000, processes=None, seed=None):
+        """Simulate the rest of the regular season. Return each team's odds of making the playoffs
+        OPTIONAL KEYWORD ARGS:
+        simulations: number of seasons to simulate. ex. simulations=10000
+                     (default is 100000)
+
+        processes: number of worker processes to run the simulations on. ex. processes=4
+                   (default runs in the current process)
+
+        seed: seed for reproducible odds. ex. seed=42
+        """
+        schedule = _parse_schedule(_league_schedule(self.current_season))
+        odds = _playoff_odds(
+            self.team_records,
+            self.division_standings,
+            self.conference_standings,
+            schedule.unplayed,
+            simulations=simulations,
+            processes=processes,
+            seed=seed
+        )
+        return odds
+
+
+def _apply_section(name, data, fetched):
+    """Install a snapshot section on the NHL class"""
+    if name == 'standings':
+        for attribute, value in data.items():
+            league_attribute = NHL.__dict__.get(attribute)
+            if isinstance(league_attribute, _LeagueAttribute):
+                league_attribute.value = value
+            else:
+                setattr(NHL, attribute, value)
+    else:
+        setattr(NHL, name, data)
+    NHL.snapshot_fetched[name] = fetched
+
+
+def _refresh_sections(names):
+    """Refetch snapshot sections from the NHL API and install them on the NHL class"""
+    for name in names:
+        try:
+            with _refreshing():
+                fetched, data = _build_section(name, NHL.current_season)
+        except Exception as error:
+            logging.error(f"Error refreshing snapshot section {name}: {error}")
+            continue
+        _apply_section(name, data, fetched)
+
+
+_REFRESHING = set()
+_REFRESH_LOCK = threading.Lock()
+
+
+def _refresh_in_background(names):
+    """Refetch snapshot sections in a background thread, skipping sections already being refetched"""
+    with _REFRESH_LOCK:
+        names = [name for name in names if name not in _REFRESHING]
+        _REFRESHING.update(names)
+    if not names:
+        return
+
+    def refresh():
+        try:
+            _refresh_sections(names)
+        finally:
+            with _REFRESH_LOCK:
+                _REFRESHING.difference_update(names)
+
+    threading.Thread(target=refresh, name='jockbot-nhl-snapshot', daemon=True).start()
+
+
+def _refresh_if_stale(name):
+    """Refetch a loaded snapshot section in the background once it is older than NHL.snapshot_max_age"""
+    fetched = NHL.snapshot_fetched.get(name)
+    if fetched is not None and time.time() - fetched > NHL.snapshot_max_age:
+        _refresh_in_background([name])
+
+
+def _snapshot_section(name):
+    """Return a loaded snapshot section, empty if none is loaded. A stale section
+    is still served while it is refetched in the background
+    """
+    if NHL.snapshot_fetched.get(name) is None:
+        return {}
+    section = getattr(NHL, name)
+    _refresh_if_stale(name)
+    return section
+
 
 class NHLTeam(NHL):
-    """Create NHL team object"""
-    def __init__(self, team=None):
+    """Create NHL team object
+    budget: seconds the requests building the team may take in total, requests
+            still outstanding when it runs out are cancelled. ex. budget=2.5
+    """
+    def __init__(self, team=None, budget=None):
         super().__init__()
         self.team = team
         self.id = _team_id(self.team)
-        self.info = self.get_team_info(team_id=self.id)
+        self.info, self.stats, self.roster, schedule, team_records = _gather([
+            lambda: self.get_team_info(team_id=self.id),
+            lambda: self.get_team_stats(self.id),
+            lambda: self.get_team_roster(self.id),
+            lambda: list(self.get_team_schedule(team_id=self.id)),
+            lambda: self.team_records
+        ], budget=budget)
         self.name = self.info['name']
         self.venue = self.info['venue']['name']
         self.conference = self.info['conference']['name']
         self.division = self.info['division']['name']
-        self.stats = self.get_team_stats(self.id)
-        self.roster = self.get_team_roster(self.id)
-        self.schedule = _parse_schedule(self.get_team_schedule(team_id=self.id))
+        self.schedule = _parse_schedule(schedule)
         self.remaining_games = self.schedule.unplayed
-        self.record = self.team_records.get(self.name)
+        self.record = team_records.get(self.name)
         self.wins = self.record['record']['wins']
         self.losses = self.record['record']['losses']
         self.otl = self.record['record']['ot']
@@ -214,6 +510,18 @@ class NHLTeam(NHL):
         self.overall_rank = self.league_standings.get(self.name)
         self.year_by_year_records = None
 
+    @property
+    def summary_stats(self):
+        return self.team_stats_matrix().team(self.id)
+
+    @property
+    def stat_ranks(self):
+        return self.team_stats_matrix().team_ranks(self.id)
+
+    @property
+    def stat_percentiles(self):
+        return self.team_stats_matrix().team_percentiles(self.id)
+
     def __repr__(self):
         return f"Team: {self.name} | NHL API ID: {self.id}"
 
@@ -221,19 +529,25 @@ class NHLTeam(NHL):
 class NHLPlayer(NHL):
     """
     Create an NHL player object
+    budget: seconds the requests building the player may take in total, requests
+            still outstanding when it runs out are cancelled. ex. budget=2.5
     """
-    def __init__(self, player, player_id=None):
+    def __init__(self, player, player_id=None, budget=None):
         super().__init__()
         self._id = player_id
         self.player = player
-        self.info = self.get_player_info(player_id=self.player_id)
-        self.season_stats = self.get_player_stats(player_id=self.player_id)
-        self.career_stats = self.get_career_stats(player_id=self.player_id)
+        with _deadline(budget):
+            self._id = self.player_id
+            self.info, self.season_stats, self.career_stats = _gather([
+                lambda: self.get_player_info(player_id=self._id),
+                lambda: self.get_player_stats(player_id=self._id),
+                lambda: self.get_career_stats(player_id=self._id)
+            ])
 
     @property
     def player_id(self):
         if not self._id:
-            self._player_id = _player_id(self.player)
+            self._player_id = _player_id(self.player, players=_snapshot_section('player_index'))
         else:
             self._player_id = self._id
         return self._player_id
@@ -242,11 +556,82 @@ class NHLPlayer(NHL):
         return f"Player: {self.player} | NHL API ID: {self.player_id}"
 
 
+class NHLGameFeed:
+    """
+    Track the live play-by-play feed of a game. The full feed is fetched once,
+    after that only the diffs since the last timecode are fetched and patched in
+    """
+    # Detailed states of games that will not go final today
+    STOPPED_STATES = ('Postponed', 'Cancelled', 'Suspended')
+
+    def __init__(self, game_id):
+        self.game_id = game_id
+        self.feed = _game_feed(self.game_id)
+        self._play_index = 0
+
+    @property
+    def timecode(self):
+        return self.feed['metaData']['timeStamp']
+
+    @property
+    def status(self):
+        return self.feed['gameData']['status']['abstractGameState']
+
+    @property
+    def ended(self):
+        """True once the game is final, postponed, cancelled or suspended"""
+        status = self.feed['gameData']['status']
+        return status['abstractGameState'] == 'Final' or status.get('detailedState') in self.STOPPED_STATES
+
+    @property
+    def plays(self):
+        return self.feed['liveData']['plays']['allPlays']
+
+    @property
+    def linescore(self):
+        return self.feed['liveData']['linescore']
+
+    def update(self):
+        """Patch the feed with every diff since the current timecode. Return list of new plays"""
+        diffs = _game_feed_diff(self.game_id, self.timecode)
+        if isinstance(diffs, dict):
+            # Upstream answers with the full feed when the timecode is too old to diff
+            self.feed = diffs
+        else:
+            for patch in diffs:
+                self.feed = _apply_patch(self.feed, patch['diff'])
+        return self.new_plays()
+
+    def new_plays(self):
+        """Return the plays added since the last call"""
+        plays = self.plays[self._play_index:]
+        self._play_index = len(self.plays)
+        return plays
+
+    def stream(self, interval=10, max_polls=None):
+        """Generator that yields plays as they happen until the game has ended
+        OPTIONAL KEYWORD ARGS:
+        interval: seconds between polls. ex. interval=5
+
+        max_polls: stop after this many polls even if the game has not ended. ex. max_polls=720
+        """
+        yield from self.new_plays()
+        polls = 0
+        while not self.ended and (max_polls is None or polls < max_polls):
+            time.sleep(interval)
+            polls += 1
+            yield from self.update()
+
+    def __repr__(self):
+        return f"Game Feed: {self.game_id} | {self.status} | {self.timecode}"
+
+
 def main():
-    """Main function"""
-    from _helpers import _pprint
-    nhl = NHL()
-    goals_against_avg_leaders = nhl.goalie_league_leaders('savePctg', season_type='3')
+    """Main function. Forwards the query to a running jockbot_nhl daemon when there is one"""
+    from jockbot_nhl._client import query
+    from jockbot_nhl._helpers import _pprint
+    request = {'attribute': 'goalie_league_leaders', 'args': ['savePctg'], 'kwargs': {'season_type': '3'}}
+    goals_against_avg_leaders = query(request)
     _pprint(goals_against_avg_leaders)
 
 
@@ -9,6 +9,7 @@ setup(name='jockbot_nhl',
       license='MIT',
       packages=['jockbot_nhl'],
       zip_safe=False,
-      install_requires=['pytz', 'requests'],
-      include_package_data=True
+      install_requires=['numpy', 'pytz', 'requests'],
+      include_package_data=True,
+      entry_points={'console_scripts': ['jockbot-nhl=jockbot_nhl._client:main']}
       )
@@ -1,8 +1,24 @@
+import datetime
+import os
+import subprocess
+import sys
+import tempfile
+import time
 import unittest
 import types
 
+import numpy as np
+
 from jockbot_nhl import nhl
+from jockbot_nhl import _cache
+from jockbot_nhl import _client
+from jockbot_nhl import _daemon
 from jockbot_nhl import _helpers
+from jockbot_nhl import _leaders
+from jockbot_nhl import _playoffs
+from jockbot_nhl import _prefetch
+from jockbot_nhl import _rosters
+from jockbot_nhl import _snapshot
 
 
 class TestNHL(unittest.TestCase):
@@ -47,6 +63,16 @@ class TestNHL(unittest.TestCase):
         message = f"Games: {games}"
         self.assertTrue(isinstance(games, dict), message)
 
+    def test_slate_cache(self):
+        """Test _helpers.SLATES serves yesterday, today and tomorrow from one request"""
+        today = _helpers._today()
+        _helpers.SLATES.games(today)
+        fetched = _helpers.SLATES.fetched
+        _helpers._recent_games()
+        _helpers._tomorrows_games()
+        self.assertEqual(_helpers.SLATES.day, today, 'Slates not keyed to today')
+        self.assertEqual(_helpers.SLATES.fetched, fetched, 'Slates refetched')
+
     def test_player_id(self):
         player_id = _helpers._player_id(self.player)
         inactive_player_id = _helpers._player_id(self.inactive_player)
@@ -78,17 +104,17 @@ class TestNHL(unittest.TestCase):
         message = f"Skater Stat Keys Do Not Match\n{leaders[0].keys()}"
         self.assertEqual(list(leaders[0].keys()), stat_keys, message)
 
-    def test_fetch_league_leaders_teams(self):
-        """Test _helpers._league_leaders_teams function"""
+    def test_fetch_team_summary(self):
+        """Test _helpers._fetch_team_summary function"""
         stat_keys = self.stat_keys['teams']
-        leaders = _helpers._fetch_league_leaders_teams('points')
-        self.assertTrue(isinstance(leaders, list), 'Incorrect leaders Type')
-        message = f"Leader Stat Keys Do Not Match\n{leaders[0].keys()}"
-        self.assertEqual(list(leaders[0].keys()), stat_keys, message)
+        summary = _helpers._fetch_team_summary()
+        self.assertTrue(isinstance(summary, list), 'Incorrect summary Type')
+        message = f"Team Stat Keys Do Not Match\n{summary[0].keys()}"
+        self.assertEqual(sorted(summary[0].keys()), sorted(stat_keys), message)
 
     def test_parse_leaders(self):
-        """Test nhl._parse_leaders function"""
-        leaders = nhl._parse_leaders('points', 'skater')
+        """Test _helpers._parse_leaders function"""
+        leaders = _helpers._parse_leaders('points', 'skater')
         print(leaders)
         self.assertTrue(isinstance(leaders, dict), 'Incorrect leaders Type')
 
@@ -152,6 +178,52 @@ class TestNHL(unittest.TestCase):
         leaders = self.league.team_league_leaders(self.skater_stat)
         self.assertTrue(isinstance(leaders, dict), 'No team stats leaders')
 
+    def test_league_leaderboards(self):
+        """Test NHL.league_leaderboards function"""
+        leaders = self.league.league_leaderboards(['points', 'goals'], num_players=5)
+        self.assertEqual(list(leaders.keys()), ['points', 'goals'], 'Missing leaderboards')
+        self.assertEqual(len(leaders['points']), 5, f"Incorrect number of players: {len(leaders['points'])}")
+
+    def test_playoff_odds(self):
+        """Test NHL.playoff_odds function"""
+        odds = self.league.playoff_odds(simulations=1000, seed=1)
+        self.assertTrue(isinstance(odds, dict), 'No playoff odds')
+        self.assertAlmostEqual(sum(odds.values()), 16, msg='Incorrect number of playoff teams')
+
+    def test_snapshot(self):
+        """Test NHL.export_snapshot and NHL.load_snapshot functions"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/nhl.snapshot"
+            self.league.export_snapshot(path)
+            stale = nhl.NHL.load_snapshot(path)
+        self.assertEqual(stale, [], 'Fresh snapshot has stale sections')
+        self.assertIn(self.team_id, self.league.rosters, 'No rosters in snapshot')
+        self.assertEqual(self.league.get_team_info(team_id=self.team_id)['name'], 'Boston Bruins')
+
+    def test_team_stats_matrix(self):
+        """Test NHL.team_stats_matrix function"""
+        matrix = self.league.team_stats_matrix()
+        self.assertEqual(matrix.values.shape, (len(matrix.teams), len(matrix.stats)), 'Incorrect matrix shape')
+        self.assertIn('points', self.team.stat_ranks, 'No team stat ranks')
+        self.assertEqual(self.team.summary_stats['points'], self.team.points, 'Incorrect team points')
+
+    def test_summary_leaders(self):
+        calls = []
+        fetch = nhl._fetch_season_summary
+        nhl._fetch_season_summary = lambda *args: calls.append(args) or self.summary().rows
+        try:
+            league = nhl.NHL()
+            leaders = league.skater_league_leaders('points', season='20192020', num_players=2)
+            self.assertEqual(list(leaders), ['B', 'C'], 'Incorrect skater leaders')
+            self.assertEqual(leaders['B'], {'team': 'TOR, BOS', 'value': 70}, 'Incorrect leader shape')
+            leaders = league.goalie_league_leaders('points', season='20192020', time_filter=25200)
+            self.assertEqual(list(leaders), ['C', 'A'], 'Time filter not applied')
+            self.assertRaises(_helpers.JockBotNHLException, league.skater_league_leaders, 'notAStat', season='20192020')
+            self.assertEqual(len(calls), 2, 'Season summary downloaded per stat')
+        finally:
+            nhl._fetch_season_summary = fetch
+            nhl.NHL.season_summaries.clear()
+
     def test_filter_stats_check(self):
         """Test nhl._filter_stats_check function"""
         self.assertTrue(nhl._filter_stats_check(), 'Filter should be True')
@@ -161,6 +233,14 @@ class TestNHL(unittest.TestCase):
         team_ids = _helpers._player_ids_by_team(self.team_city)
         self.assertTrue(isinstance(team_ids, dict), 'No team player IDs')
 
+    def test_roster_tracker(self):
+        """Test _rosters.RosterTracker refresh"""
+        tracker = _rosters.RosterTracker(team_ids=[self.team_id])
+        changes = tracker.refresh()
+        self.assertEqual(changes[self.team_id].version, 1, 'Incorrect roster version')
+        self.assertEqual(tracker.players[self.player], self.player_id, 'Incorrect Player ID')
+        self.assertEqual(tracker.refresh(), {}, 'Unchanged roster reported changes')
+
     def test_team_ranks(self):
         overall_rank = self.team.overall_rank
         conference_rank = self.team.conference_rank
@@ -175,5 +255,514 @@ class TestNHL(unittest.TestCase):
         self.assertEqual(self.team.conference, 'Eastern')
 
 
+class FakeRedis:
+    """Local stand-in for a Redis client. Values are returned as bytes like redis.Redis"""
+    def __init__(self):
+        self.store = {}
+        self.now = time.time
+
+    def get(self, key):
+        value, expires = self.store.get(key, (None, None))
+        if expires is not None and expires <= self.now():
+            del self.store[key]
+            return None
+        return value
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and self.get(key) is not None:
+            return False
+        value = value.encode() if isinstance(value, str) else value
+        self.store[key] = (value, None if ex is None else self.now() + ex)
+        return True
+
+    def delete(self, key):
+        self.store.pop(key, None)
+
+
+class TestCache(unittest.TestCase):
+    """Test _cache.py"""
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.caches = [_cache.FileCache(self.directory.name), _cache.RedisCache(FakeRedis())]
+        self.calls = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def fetch(self):
+        self.calls.append(1)
+        return {'teams': [6]}
+
+    def test_fetch(self):
+        for cache in self.caches:
+            self.calls = []
+            self.assertEqual(cache.fetch('teams/6', self.fetch), {'teams': [6]})
+            self.assertEqual(cache.fetch('teams/6', self.fetch), {'teams': [6]})
+            self.assertEqual(len(self.calls), 1, f"{cache} fetched more than once")
+
+    def test_expired(self):
+        file_cache, redis_cache = self.caches
+        file_cache.set('teams/6', {'teams': [6]}, ttl=-1)
+        self.assertIsNone(file_cache.get('teams/6'), 'Expired entry returned')
+        redis_cache.set('teams/6', {'teams': [6]}, ttl=5)
+        redis_cache.client.now = lambda: time.time() + 10
+        self.assertIsNone(redis_cache.get('teams/6'), 'Expired entry returned')
+
+    def test_lock_contention(self):
+        client = FakeRedis()
+        cache = _cache.RedisCache(client, lock_timeout=0.1, poll_interval=0.01)
+        client.set('jockbot_nhl:lock:teams/6', 'other-worker', nx=True, ex=30)
+        self.assertEqual(cache.fetch('teams/6', self.fetch), {'teams': [6]})
+        self.assertEqual(len(self.calls), 1, 'Value not fetched after lock timeout')
+        self.assertEqual(client.get('jockbot_nhl:lock:teams/6'), b'other-worker', "Another worker's lock deleted")
+        client.delete('jockbot_nhl:lock:teams/6')
+        cache.fetch('teams/7', self.fetch)
+        self.assertIsNone(client.get('jockbot_nhl:lock:teams/7'), 'Own lock not released')
+
+
+class TestDeadline(unittest.TestCase):
+    """Test _helpers request deadlines"""
+    def test_timeout(self):
+        self.assertEqual(_helpers._timeout(), _helpers.REQUEST_TIMEOUT, 'Incorrect default timeout')
+        with _helpers._deadline(1):
+            self.assertLessEqual(_helpers._timeout(), 1, 'Timeout exceeds deadline')
+            with _helpers._deadline(60):
+                self.assertLessEqual(_helpers._timeout(), 1, 'Nested deadline extended budget')
+
+    def test_expired(self):
+        with _helpers._deadline(0):
+            self.assertRaises(_helpers.JockBotNHLTimeout, _helpers._timeout)
+
+    def test_gather(self):
+        results = _helpers._gather([lambda: 1, lambda: 2], budget=1)
+        self.assertEqual(results, [1, 2], 'Incorrect gather results')
+        self.assertRaises(_helpers.JockBotNHLTimeout, _helpers._gather, [lambda: time.sleep(1)], budget=0.01)
+
+
+class TestSnapshot(unittest.TestCase):
+    """Test snapshot sections served from the NHL class"""
+    def setUp(self):
+        self.saved = {name: nhl.NHL.__dict__[name] for name in ('current_season', 'rosters', 'snapshot_fetched')}
+        self.builder = _snapshot.SECTIONS['rosters']
+        nhl.NHL.current_season = '20192020'
+        nhl.NHL.rosters = {6: ['old']}
+        nhl.NHL.snapshot_fetched = {'rosters': time.time()}
+        _snapshot.SECTIONS['rosters'] = lambda season: {6: ['new']}
+
+    def tearDown(self):
+        _snapshot.SECTIONS['rosters'] = self.builder
+        for name, value in self.saved.items():
+            setattr(nhl.NHL, name, value)
+
+    def test_fresh_section(self):
+        self.assertEqual(nhl.NHL().get_team_roster(team_id=6), ['old'], 'Snapshot roster not served')
+        self.assertEqual(nhl.NHL.rosters, {6: ['old']}, 'Fresh section refreshed')
+
+    def test_stale_section(self):
+        nhl.NHL.snapshot_fetched['rosters'] = time.time() - nhl.NHL.snapshot_max_age - 1
+        self.assertEqual(nhl.NHL().get_team_roster(team_id=6), ['old'], 'Stale roster not served while refreshing')
+        for _ in range(100):
+            if nhl.NHL.rosters == {6: ['new']}:
+                break
+            time.sleep(0.01)
+        self.assertEqual(nhl.NHL.rosters, {6: ['new']}, 'Stale section not refreshed')
+
+    def test_stale_standings(self):
+        standings = _snapshot.SECTIONS['standings']
+        _snapshot.SECTIONS['standings'] = lambda season: {'team_records': {'Boston Bruins': 'new'}}
+        records = nhl.NHL.__dict__['team_records']
+        value = records.value
+        records.value = {'Boston Bruins': 'old'}
+        nhl.NHL.snapshot_fetched['standings'] = time.time() - nhl.NHL.snapshot_max_age - 1
+        try:
+            self.assertEqual(nhl.NHL.team_records, {'Boston Bruins': 'old'}, 'Stale standings not served')
+            for _ in range(100):
+                if nhl.NHL.team_records == {'Boston Bruins': 'new'}:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(nhl.NHL.team_records, {'Boston Bruins': 'new'}, 'Stale standings not refreshed')
+        finally:
+            _snapshot.SECTIONS['standings'] = standings
+            records.value = value
+
+    def test_schedules_all_game_types(self):
+        calls = []
+        league_schedule = _snapshot._league_schedule
+        _snapshot._league_schedule = lambda season, game_type='R': calls.append(game_type) or []
+        try:
+            _snapshot._schedules_section('20192020')
+        finally:
+            _snapshot._league_schedule = league_schedule
+        self.assertEqual(calls, [None], 'Schedules section filtered game types')
+
+
+class TestPrefetch(unittest.TestCase):
+    """Test _prefetch.PrefetchScheduler with a stubbed slate"""
+    def setUp(self):
+        self.saved = {
+            name: getattr(_prefetch, name)
+            for name in ('_todays_games', '_warm_roster', '_warm_team_stats', '_refresh_sections')
+        }
+        self.cache = _helpers.CACHE
+        _helpers.CACHE = _cache.RedisCache(FakeRedis())
+        self.calls = []
+        self.now = time.time()
+        self.slate = {'date': '2019-11-01', 'games': [
+            self.game(1, 'Preview', self.now + 60),
+            self.game(2, 'Preview', self.now + 7200),
+            self.game(3, 'Live', self.now - 600),
+            self.game(4, 'Final', self.now - 9000)
+        ]}
+        _prefetch._todays_games = lambda: self.slate
+        _prefetch._warm_roster = lambda team_id: self.calls.append(('roster', team_id))
+        _prefetch._warm_team_stats = lambda team_id: self.calls.append(('stats', team_id))
+        _prefetch._refresh_sections = lambda names: self.calls.append(('standings',))
+        self.scheduler = _prefetch.PrefetchScheduler(lead_time=240)
+
+    def tearDown(self):
+        self.scheduler.stop()
+        _helpers.CACHE = self.cache
+        for name, value in self.saved.items():
+            setattr(_prefetch, name, value)
+
+    def game(self, game_id, status, start):
+        start = datetime.datetime.fromtimestamp(start, datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        teams = {'away': {'team': {'id': game_id * 10}}, 'home': {'team': {'id': game_id * 10 + 1}}}
+        return {'gamePk': game_id, 'gameDate': start, 'status': {'abstractGameState': status}, 'teams': teams}
+
+    def run_once(self):
+        for future in self.scheduler.run_once(now=self.now):
+            future.result()
+
+    def test_requires_cache(self):
+        _helpers.CACHE = None
+        self.assertRaises(_helpers.JockBotNHLException, _prefetch.PrefetchScheduler)
+
+    def test_phases(self):
+        self.run_once()
+        self.assertEqual(self.scheduler.done, {(1, 'pregame'), (4, 'final')}, 'Incorrect game phases')
+        expected = [
+            ('standings',), ('stats', 10), ('stats', 11), ('roster', 10), ('roster', 11), ('stats', 40), ('stats', 41)
+        ]
+        self.assertEqual(sorted(self.calls), sorted(expected), 'Incorrect warm-ups')
+
+    def test_done(self):
+        self.run_once()
+        self.calls = []
+        self.run_once()
+        self.assertEqual(self.calls, [], 'Games warmed twice')
+
+    def test_day_reset(self):
+        self.run_once()
+        self.calls = []
+        self.slate = dict(self.slate, date='2019-11-02')
+        self.run_once()
+        self.assertIn(('roster', 10), self.calls, 'Warm-ups not reset for a new day')
+
+    def test_refreshing(self):
+        values = iter([1, 2, 3])
+        url = 'https://statsapi.web.nhl.com/api/v1/standings'
+        self.assertEqual(_helpers._cached(url, lambda: next(values)), 1)
+        self.assertEqual(_helpers._cached(url, lambda: next(values)), 1, 'Cache miss')
+        with _helpers._refreshing():
+            self.assertEqual(_helpers._cached(url, lambda: next(values)), 2, 'Cached value served while refreshing')
+        self.assertEqual(_helpers._cached(url, lambda: next(values)), 2, 'Refreshed value not cached')
+
+    def test_warm_snapshot_roster(self):
+        current_season, rosters = vars(nhl.NHL)['current_season'], nhl.NHL.rosters
+        requests = []
+
+        def api_request(endpoint):
+            requests.append((endpoint, _helpers.REFRESH.get()))
+            return {'roster': ['new']}
+        _prefetch._api_request, api_request = api_request, _prefetch._api_request
+        nhl.NHL.current_season, nhl.NHL.rosters = '20192020', {6: ['old']}
+        try:
+            self.saved['_warm_roster'](6)
+            self.assertEqual(requests, [('teams/6/roster?season=20192020', True)], 'Roster not refetched')
+            self.assertEqual(nhl.NHL.rosters[6], ['new'], 'Snapshot roster not updated')
+        finally:
+            _prefetch._api_request = api_request
+            nhl.NHL.current_season, nhl.NHL.rosters = current_season, rosters
+
+    def test_budget(self):
+        self.scheduler.budget = 5
+        self.assertTrue(self.scheduler._spend(4), 'Budget refused within limit')
+        self.assertFalse(self.scheduler._spend(2), 'Budget exceeded')
+        self.assertTrue(self.scheduler._spend(1), 'Budget refused within limit')
+        self.scheduler.spent[0] -= self.scheduler.budget_window + 1
+        self.assertTrue(self.scheduler._spend(1), 'Expired spend not released')
+
+
+class FakeInstances:
+    def __init__(self, obj):
+        self.obj = obj
+
+    def get(self, name, init):
+        return self.obj
+
+
+class FakeLeague:
+    current_season = '20192020'
+
+    def recent_games(self):
+        return (game for game in ['a', 'b'])
+
+    def export_snapshot(self, path):
+        raise AssertionError('export_snapshot reached')
+
+
+class TestDaemon(unittest.TestCase):
+    def setUp(self):
+        self.instances = FakeInstances(FakeLeague())
+
+    def test_execute(self):
+        result = _daemon._execute({'attribute': 'current_season'}, self.instances)
+        self.assertEqual(result, '20192020', 'Incorrect attribute')
+        result = _daemon._execute({'attribute': 'recent_games'}, self.instances)
+        self.assertEqual(result, ['a', 'b'], 'Generator not returned as a list')
+
+    def test_execute_rejected(self):
+        for attribute in ('export_snapshot', 'load_snapshot', '_cached', 'player_index'):
+            request = {'attribute': attribute, 'args': ['/tmp/x']}
+            self.assertRaises(_helpers.JockBotNHLException, _daemon._execute, request, self.instances)
+        request = {'object': 'NHLGameFeed', 'attribute': 'feed'}
+        self.assertRaises(_helpers.JockBotNHLException, _daemon._execute, request, self.instances)
+
+    def test_parse_kwarg(self):
+        self.assertEqual(_client._parse_kwarg('num_players=5'), ('num_players', 5), 'JSON value not decoded')
+        self.assertEqual(_client._parse_kwarg('player_name=patrice bergeron'), ('player_name', 'patrice bergeron'))
+        self.assertEqual(_client._parse_kwarg('season_type="3"'), ('season_type', '3'), 'JSON string not decoded')
+        self.assertEqual(_client._parse_kwarg('filter=a=b'), ('filter', 'a=b'), 'Value split on second =')
+
+    def test_client_imports(self):
+        code = 'import sys, jockbot_nhl._client; print(sorted({"numpy", "requests", "pytz"} & set(sys.modules)))'
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=root)
+        self.assertEqual(output.strip(), b'[]', 'Client imports heavy dependencies')
+
+    def test_query_errors(self):
+        path = os.path.join(tempfile.mkdtemp(), 'nhl.sock')
+        saved = _daemon._Instances, _daemon._execute
+        _daemon._Instances = lambda: None
+        _daemon._execute = lambda request, instances: {}['points']
+        try:
+            self.assertRaises(_helpers.JockBotNHLException, _client.query, {'attribute': 'standings'}, path)
+        finally:
+            _daemon._Instances, _daemon._execute = saved
+        with _daemon.socket.socket(_daemon.socket.AF_UNIX, _daemon.socket.SOCK_STREAM) as server:
+            server.bind(path)
+            server.listen(1)
+            self.assertRaises(_helpers.JockBotNHLException, _client.query, {'attribute': 'standings'}, path, 0.1)
+
+    def test_league_refresh(self):
+        refreshed = []
+        refresh_in_background = _daemon._refresh_in_background
+        _daemon._refresh_in_background = refreshed.extend
+        try:
+            instances = _daemon._Instances(max_age=300)
+            instances.get('NHL', [])
+            self.assertEqual(refreshed, [], 'Fresh standings refreshed')
+            instances.started -= 301
+            instances.get('NHL', [])
+            self.assertEqual(refreshed, ['standings'], 'Stale standings not refreshed')
+        finally:
+            _daemon._refresh_in_background = refresh_in_background
+
+    def test_live_socket(self):
+        path = os.path.join(tempfile.mkdtemp(), 'nhl.sock')
+        with _daemon.socket.socket(_daemon.socket.AF_UNIX, _daemon.socket.SOCK_STREAM) as server:
+            server.bind(path)
+            server.listen(1)
+            self.assertRaises(_helpers.JockBotNHLException, _daemon._remove_stale_socket, path)
+            self.assertTrue(os.path.exists(path), 'Live socket removed')
+        _daemon._remove_stale_socket(path)
+        self.assertFalse(os.path.exists(path), 'Stale socket not removed')
+
+
+class TestRosters(unittest.TestCase):
+    """Test _rosters.RosterTracker without the NHL API"""
+    def setUp(self):
+        self.player_index = nhl.NHL.player_index
+        nhl.NHL.player_index = {'zdeno chara': 8465009}
+        self.tracker = _rosters.RosterTracker(team_ids=[6, 15])
+        self.rosters = {6: [8465009], 15: []}
+        self.tracker._fetch = self.fetch
+
+    def tearDown(self):
+        nhl.NHL.player_index = self.player_index
+
+    def fetch(self, team_id):
+        if self.rosters[team_id] is None:
+            raise _helpers.JockBotNHLException('DNS failure')
+        names = {8465009: 'Zdeno Chara', 8480001: 'Jack Studnicka'}
+        players = {i: {'person': {'id': i, 'fullName': names[i]}} for i in self.rosters[team_id]}
+        return players, None, None
+
+    def test_player_index(self):
+        self.tracker.refresh()
+        self.rosters[6] = [8465009, 8480001]
+        changes = self.tracker.refresh()
+        self.assertEqual(len(changes[6].added), 1, 'Call-up not reported')
+        self.assertEqual(nhl.NHL.player_index.get('jack studnicka'), 8480001, 'Call-up not in NHL.player_index')
+        self.assertEqual(_helpers._player_id('jack studnicka', players=nhl.NHL.player_index), 8480001)
+
+    def test_failed_team(self):
+        self.rosters[15] = None
+        changes = self.tracker.refresh()
+        self.assertIn(6, changes, 'One failed team aborted the refresh')
+        self.assertNotIn(15, self.tracker.rosters, 'Failed team recorded')
+
+
+class TestLeaders(unittest.TestCase):
+    """Test _leaders.py without the NHL API"""
+    def setUp(self):
+        self.teams = [
+            {'teamId': 6, 'teamFullName': 'Boston Bruins', 'points': 100, 'goalsAgainst': 170},
+            {'teamId': 15, 'teamFullName': 'Washington Capitals', 'points': 90, 'goalsAgainst': 210},
+            {'teamId': 19, 'teamFullName': 'St. Louis Blues', 'points': 94, 'goalsAgainst': None}
+        ]
+
+    def summary(self):
+        return _leaders._SeasonSummary([
+            {'playerName': 'A', 'playerTeamsPlayedFor': 'BOS', 'points': 50, 'gamesPlayed': 40, 'timeOnIce': 40000},
+            {'playerName': 'B', 'playerTeamsPlayedFor': 'TOR, BOS', 'points': 70, 'gamesPlayed': 10, 'timeOnIce': 9000},
+            {'playerName': 'C', 'playerTeamsPlayedFor': 'WSH', 'points': 60, 'gamesPlayed': 41, 'timeOnIce': 42000},
+            {'playerName': 'D', 'playerTeamsPlayedFor': 'WSH', 'points': None, 'gamesPlayed': 2, 'timeOnIce': 600}
+        ])
+
+    def test_top(self):
+        summary = self.summary()
+        self.assertEqual(list(summary.top('points', 2)), [1, 2], 'Incorrect top rows')
+        self.assertEqual(list(summary.top('points', 10, reverse=False)), [0, 2, 1], 'Missing values not dropped')
+        mask = summary.mask(team='WSH')
+        self.assertEqual(list(summary.top('points', 10, mask=mask)), [2], 'Mask not applied')
+
+    def test_mask(self):
+        summary = self.summary()
+        self.assertEqual(list(summary.mask(time_filter=25200)), [True, False, True, False], 'Incorrect time filter')
+        self.assertEqual(list(summary.mask(min_games=20)), [True, False, True, False], 'Incorrect games filter')
+        self.assertEqual(list(summary.mask(team='bos')), [True, True, False, False], 'Incorrect team filter')
+        where = summary.mask(where=lambda s: s.column('gamesPlayed') > 5, team='WSH')
+        self.assertEqual(list(where), [False, False, True, False], 'Incorrect where filter')
+
+    def test_season_summary_cache(self):
+        calls = []
+        fetch = nhl._fetch_season_summary
+        nhl._fetch_season_summary = lambda *args: calls.append(args) or []
+        try:
+            league = nhl.NHL()
+            league.season_summary('goalie', '20192020')
+            league.season_summary('goalie', '20192020')
+            self.assertEqual(len(calls), 1, 'Season summary downloaded twice')
+        finally:
+            nhl._fetch_season_summary = fetch
+            nhl.NHL.season_summaries.clear()
+
+    def test_summary_leaders(self):
+        calls = []
+        fetch = nhl._fetch_season_summary
+        nhl._fetch_season_summary = lambda *args: calls.append(args) or self.summary().rows
+        try:
+            league = nhl.NHL()
+            leaders = league.skater_league_leaders('points', season='20192020', num_players=2)
+            self.assertEqual(list(leaders), ['B', 'C'], 'Incorrect skater leaders')
+            self.assertEqual(leaders['B'], {'team': 'TOR, BOS', 'value': 70}, 'Incorrect leader shape')
+            leaders = league.goalie_league_leaders('points', season='20192020', time_filter=25200)
+            self.assertEqual(list(leaders), ['C', 'A'], 'Time filter not applied')
+            self.assertRaises(_helpers.JockBotNHLException, league.skater_league_leaders, 'notAStat', season='20192020')
+            self.assertEqual(len(calls), 2, 'Season summary downloaded per stat')
+        finally:
+            nhl._fetch_season_summary = fetch
+            nhl.NHL.season_summaries.clear()
+
+    def test_filter_stats_check(self):
+        self.assertTrue(_helpers._filter_stats_check('2000-10-01'), 'Old season not filtered')
+        self.assertFalse(_helpers._filter_stats_check(str(datetime.date.today())), 'New season filtered')
+
+    def test_team_league_leaders(self):
+        league = nhl.NHL()
+        league.team_stats_matrix = lambda season=None, season_type='2': _leaders._TeamStatsMatrix(self.teams)
+        leaders = league.team_league_leaders('goalsAgainst', reverse=True)
+        self.assertEqual(list(leaders), ['Boston Bruins', 'Washington Capitals', 'St. Louis Blues'])
+        self.assertRaises(_helpers.JockBotNHLException, league.team_league_leaders, 'notAStat')
+
+    def test_missing_team_stats(self):
+        matrix = _leaders._TeamStatsMatrix([
+            {'teamId': 6, 'teamFullName': 'Boston Bruins', 'points': 100, 'ppPct': 0.25},
+            {'teamId': 15, 'teamFullName': 'Washington Capitals', 'points': 90}
+        ])
+        self.assertEqual(matrix.team(15), {'points': 90, 'ppPct': None}, 'Missing stat not None')
+        self.assertEqual(list(matrix.leaders('ppPct').items())[-1], ('Washington Capitals', None))
+
+
+class TestGameFeed(unittest.TestCase):
+    """Test live game feed helpers without the NHL API"""
+    def test_apply_patch(self):
+        """Test _helpers._apply_patch function"""
+        feed = {'metaData': {'timeStamp': '1'}, 'liveData': {'plays': {'allPlays': [{'id': 1}]}}}
+        patch = [
+            {'op': 'replace', 'path': '/metaData/timeStamp', 'value': '2'},
+            {'op': 'add', 'path': '/liveData/plays/allPlays/-', 'value': {'id': 2}},
+            {'op': 'copy', 'from': '/liveData/plays/allPlays/0', 'path': '/liveData/plays/allPlays/0'},
+            {'op': 'remove', 'path': '/liveData/plays/allPlays/0'}
+        ]
+        feed = _helpers._apply_patch(feed, patch)
+        self.assertEqual(feed['metaData']['timeStamp'], '2', 'Timecode not replaced')
+        self.assertEqual(feed['liveData']['plays']['allPlays'], [{'id': 1}, {'id': 2}], 'Plays not patched')
+
+    def game_feed(self, abstract, detailed):
+        game = nhl.NHLGameFeed.__new__(nhl.NHLGameFeed)
+        game.game_id, game._play_index = 2019020010, 0
+        game.feed = {
+            'metaData': {'timeStamp': '1'},
+            'gameData': {'status': {'abstractGameState': abstract, 'detailedState': detailed}},
+            'liveData': {'plays': {'allPlays': [{'id': 1}]}}
+        }
+        return game
+
+    def test_stream_stops(self):
+        polls = []
+        game_feed_diff = nhl._game_feed_diff
+        nhl._game_feed_diff = lambda game_id, timecode: polls.append(timecode) or []
+        try:
+            plays = list(self.game_feed('Preview', 'Postponed').stream(interval=0))
+            self.assertEqual((plays, polls), ([{'id': 1}], []), 'Postponed game polled')
+            plays = list(self.game_feed('Live', 'In Progress').stream(interval=0, max_polls=3))
+            self.assertEqual(len(polls), 3, 'max_polls not honoured')
+        finally:
+            nhl._game_feed_diff = game_feed_diff
+
+
+class TestPlayoffs(unittest.TestCase):
+    """Test _playoffs.py without the NHL API"""
+    def setUp(self):
+        # Two conferences of two five team divisions, 16 playoff spots
+        self.divisions = [np.arange(i, i + 5) for i in range(0, 20, 5)]
+        self.conferences = [np.arange(0, 10), np.arange(10, 20)]
+        self.base = np.zeros((4, 20))
+        self.base[0, 0] = 1000
+        self.base[0, 19] = -1000
+        rng = np.random.default_rng(0)
+        self.home = rng.integers(0, 20, 200)
+        self.away = (self.home + rng.integers(1, 20, 200)) % 20
+        self.p_home = np.full(200, 0.5)
+
+    def simulate(self, seed):
+        args = (self.base, self.home, self.away, self.p_home, self.divisions, self.conferences, 500, seed)
+        return _playoffs._simulate_chunk(args)
+
+    def test_simulate_chunk(self):
+        counts = self.simulate(1)
+        self.assertEqual(counts.sum(), 16 * 500, 'Incorrect number of qualifiers')
+        self.assertEqual(counts[0], 500, 'Clinched team missed the playoffs')
+        self.assertEqual(counts[19], 0, 'Eliminated team made the playoffs')
+        for conference in self.conferences:
+            self.assertEqual(counts[conference].sum(), 8 * 500, 'Incorrect qualifiers per conference')
+
+    def test_seed(self):
+        self.assertEqual(list(self.simulate(7)), list(self.simulate(7)), 'Seeded simulations differ')
+
+
 if __name__ == '__main__':
     unittest.main()